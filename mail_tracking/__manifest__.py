@@ -7,7 +7,7 @@
 {
     "name": "Email tracking",
     "summary": "Email tracking system for all mails sent",
-    "version": "16.0.1.0.5",
+    "version": "16.0.1.7.0",
     "category": "Social Network",
     "website": "https://github.com/OCA/social",
     "author": ("Tecnativa, " "Odoo Community Association (OCA)"),
@@ -17,12 +17,21 @@
     "depends": ["mail"],
     "data": [
         "data/tracking_data.xml",
+        "data/mail_tracking_event_queue_cron.xml",
+        "data/mail_tracking_email_archive_cron.xml",
+        "data/mail_tracking_stats_daily_cron.xml",
         "security/mail_tracking_email_security.xml",
         "security/ir.model.access.csv",
         "views/mail_tracking_email_view.xml",
         "views/mail_tracking_event_view.xml",
+        "views/mail_tracking_address_stats_view.xml",
+        "views/mail_tracking_event_queue_view.xml",
+        "views/mail_tracking_event_queue_report_view.xml",
+        "views/mail_tracking_email_archive_view.xml",
+        "views/mail_tracking_stats_daily_view.xml",
         "views/mail_message_view.xml",
         "views/res_partner_view.xml",
+        "wizards/mail_tracking_export_views.xml",
     ],
     "assets": {
         "web.assets_backend": [
@@ -55,4 +64,5 @@
         ],
     },
     "demo": ["demo/demo.xml"],
+    "post_init_hook": "post_init_hook",
 }
@@ -0,0 +1,36 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+import werkzeug
+
+import odoo
+from odoo import api, http
+from odoo.http import content_disposition
+
+
+class MailTrackingExportController(http.Controller):
+    def _mail_tracking_export_stream(self, dbname, uid, context, export_id):
+        """Generate the export with its own cursor, as the response is sent
+        once the request cursor has been closed.
+        """
+        with odoo.registry(dbname).cursor() as cr:
+            env = api.Environment(cr, uid, context)
+            yield from env["mail.tracking.export"].browse(export_id)._export_stream()
+
+    @http.route("/mail/tracking/export/<int:export_id>", type="http", auth="user")
+    def mail_tracking_export(self, export_id, **kwargs):
+        env = http.request.env
+        if not env.user.has_group("base.group_system"):
+            raise werkzeug.exceptions.Forbidden()
+        export = env["mail.tracking.export"].browse(export_id).exists()
+        if not export:
+            raise werkzeug.exceptions.NotFound()
+        return werkzeug.wrappers.Response(
+            self._mail_tracking_export_stream(
+                env.cr.dbname, env.uid, dict(env.context), export.id
+            ),
+            headers=[
+                ("Content-Type", export._export_mimetype()),
+                ("Content-Disposition", content_disposition(export._export_filename())),
+            ],
+            direct_passthrough=True,
+        )
@@ -3,12 +3,13 @@
 
 import base64
 import logging
+import time
 from contextlib import contextmanager
 
 import werkzeug
 
 import odoo
-from odoo import SUPERUSER_ID, api, http
+from odoo import SUPERUSER_ID, api, http, tools
 
 from odoo.addons.mail.controllers.mail import MailController
 
@@ -40,6 +41,20 @@ class MailTrackingController(MailController):
             "ua_family": request.user_agent.browser or False,
         }
 
+    def _mail_tracking_blank_response(self):
+        response = werkzeug.wrappers.Response()
+        response.mimetype = "image/gif"
+        response.data = base64.b64decode(BLANK)
+        return response
+
+    def _mail_tracking_open_fast_path(self, env):
+        """Stage the open events instead of processing them in the request"""
+        return tools.str2bool(
+            env["ir.config_parameter"]
+            .sudo()
+            .get_param("mail_tracking.open_fast_path", "False")
+        )
+
     @http.route(
         [
             "/mail/tracking/open/<string:db>/<int:tracking_email_id>/blank.gif",
@@ -55,6 +70,14 @@ class MailTrackingController(MailController):
         metadata = self._request_metadata()
         with db_env(db) as env:
             try:
+                if self._mail_tracking_open_fast_path(env):
+                    # Only validate and stage the hit, the event will be
+                    # created later by the queue cron
+                    metadata["timestamp"] = time.time()
+                    env["mail.tracking.event.queue"]._stage_open(
+                        tracking_email_id, token, metadata
+                    )
+                    return self._mail_tracking_blank_response()
                 tracking_email = (
                     env["mail.tracking.email"]
                     .sudo()
@@ -70,7 +93,4 @@ class MailTrackingController(MailController):
                 _logger.warning(e)
 
         # Always return GIF blank image
-        response = werkzeug.wrappers.Response()
-        response.mimetype = "image/gif"
-        response.data = base64.b64decode(BLANK)
-        return response
+        return self._mail_tracking_blank_response()
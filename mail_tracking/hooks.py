@@ -0,0 +1,9 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+from odoo import SUPERUSER_ID, api
+
+
+def post_init_hook(cr, registry):
+    """Fill the address statistics with the already existing trackings"""
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    env["mail.tracking.address.stats"]._rebuild()
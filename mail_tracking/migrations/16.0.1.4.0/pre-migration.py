@@ -0,0 +1,33 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+import logging
+
+_logger = logging.getLogger(__name__)
+
+FAILED_STATES = ("error", "rejected", "spam", "bounced", "soft-bounced")
+
+
+def migrate(cr, version):
+    """Create and fill the mail_tracking_failed column with SQL, to avoid
+    recomputing it for every message through the ORM.
+    """
+    _logger.info("Flagging failed tracked messages")
+    cr.execute(
+        """
+        ALTER TABLE mail_message
+        ADD COLUMN IF NOT EXISTS mail_tracking_failed boolean
+        """
+    )
+    cr.execute(
+        """
+        UPDATE mail_message message
+        SET mail_tracking_failed = TRUE
+        WHERE message.mail_tracking_needs_action
+            AND EXISTS (
+                SELECT 1 FROM mail_tracking_email tracking
+                WHERE tracking.mail_message_id = message.id
+                    AND tracking.state IN %s
+            )
+        """,
+        (FAILED_STATES,),
+    )
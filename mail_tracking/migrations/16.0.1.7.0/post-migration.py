@@ -0,0 +1,64 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+import logging
+
+from odoo import SUPERUSER_ID, api
+from odoo.tools import email_normalize
+
+_logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 10000
+
+
+def _recipient_address_backfill(cr, table):
+    """Normalize again the recipient addresses of a table, by batches of ids,
+    only writing the ones that change.
+    """
+    _logger.info("Normalizing the recipient addresses of %s", table)
+    last_id = 0
+    while True:
+        cr.execute(
+            """
+            SELECT id, recipient, recipient_address FROM {table}
+            WHERE id > %s ORDER BY id LIMIT %s
+            """.format(
+                table=table
+            ),
+            (last_id, BATCH_SIZE),
+        )
+        rows = cr.fetchall()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        changes = []
+        for row_id, recipient, recipient_address in rows:
+            # Same as mail_tracking.tools.email_address_normalize
+            address = recipient and email_normalize(recipient, strict=False) or None
+            if address != recipient_address:
+                changes.extend([row_id, address])
+        if changes:
+            cr.execute(
+                """
+                UPDATE {table} target
+                SET recipient_address = changes.address
+                FROM (VALUES {values}) AS changes(id, address)
+                WHERE target.id = changes.id
+                """.format(
+                    table=table,
+                    values=", ".join(["(%s, %s::varchar)"] * (len(changes) // 2)),
+                ),
+                changes,
+            )
+
+
+def migrate(cr, version):
+    for table in (
+        "mail_tracking_email",
+        "mail_tracking_event",
+        "mail_tracking_email_archive",
+    ):
+        _recipient_address_backfill(cr, table)
+    # Single build of the address counters, also for the databases upgraded
+    # from a version older than 16.0.1.1.0 where they were introduced
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    env["mail.tracking.address.stats"]._rebuild()
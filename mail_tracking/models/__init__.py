@@ -4,8 +4,15 @@ from . import ir_mail_server
 from . import mail_bounced_mixin
 from . import mail_mail
 from . import mail_message
+from . import mail_tracking_address_stats
+from . import mail_tracking_checkpoint
 from . import mail_tracking_email
+from . import mail_tracking_email_archive
 from . import mail_tracking_event
+from . import mail_tracking_event_archive
+from . import mail_tracking_event_queue
+from . import mail_tracking_event_queue_report
+from . import mail_tracking_stats_daily
 from . import res_partner
 from . import mail_thread
 from . import mail_resend_message
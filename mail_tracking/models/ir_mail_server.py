@@ -1,11 +1,12 @@
 # Copyright 2016 Antonio Espinosa - <antonio.espinosa@tecnativa.com>
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
 
-import re
 import threading
 
 from odoo import api, models, tools
 
+from ..tools import tracking_img_parse, tracking_img_remove
+
 
 class IrMailServer(models.Model):
     _inherit = "ir.mail_server"
@@ -18,15 +19,13 @@ class IrMailServer(models.Model):
         return headers
 
     def _tracking_email_id_body_get(self, body):
-        body = body or ""
-        # https://regex101.com/r/lW4cB1/2
-        match = re.search(r'<img[^>]*data-odoo-tracking-email=["\']([0-9]*)["\']', body)
-        return str(match.group(1)) if match and match.group(1) else False
+        return tracking_img_parse(body or "")[0]
 
     def _tracking_img_disabled(self, tracking_email_id):
         # while tracking_email_id is not needed in this implementation, it can
         # be useful for other addons extending this function to make a more
-        # fine-grained decision
+        # fine-grained decision. The parameter is read from the registry
+        # cache, which is invalidated when it is changed
         return (
             self.env["ir.config_parameter"]
             .sudo()
@@ -34,9 +33,7 @@ class IrMailServer(models.Model):
         )
 
     def _tracking_img_remove(self, body):
-        return re.sub(
-            r'<img[^>]*data-odoo-tracking-email=["\'][0-9]*["\'][^>]*>', "", body
-        )
+        return tracking_img_remove(body)
 
     def build_email(
         self,
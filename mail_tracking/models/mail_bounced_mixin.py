@@ -1,18 +1,27 @@
 # Copyright 2018 Tecnativa - Ernesto Tejeda
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
 
-from odoo import fields, models
+from collections import defaultdict
+
+from odoo import api, fields, models
+from odoo.osv import expression
+
+from ..tools import email_address_normalize
+from .mail_tracking_email import BOUNCED_STATES
 
 
 class MailBouncedMixin(models.AbstractModel):
     """A mixin class to use if you want to add is_bounced flag on a model.
     The field '_primary_email' must be overridden in the model that inherit
-    the mixin and must contain the email field of the model.
+    the mixin and must contain the email field of the model. When the model
+    has a stored normalized version of that email, its name can be set in
+    '_primary_email_normalized' to look records up by address efficiently.
     """
 
     _name = "mail.bounced.mixin"
     _description = "Mail bounced mixin"
     _primary_email = "email"
+    _primary_email_normalized = "email_normalized"
 
     email_bounced = fields.Boolean(index=True)
 
@@ -26,18 +35,113 @@ class MailBouncedMixin(models.AbstractModel):
         partners = self.filtered(lambda r: not r.email_bounced)
         return partners.write({"email_bounced": True})
 
+    @api.model
+    def _email_bounced_search(self, addresses):
+        """Search the records using any of the given addresses at once
+
+        :return: dictionary {normalized address: records}
+        """
+        addresses = {email_address_normalize(x) for x in addresses} - {False}
+        res = defaultdict(self.browse)
+        if not addresses:
+            return res
+        field_name = self._primary_email_normalized
+        field = self._fields.get(field_name)
+        if field and field.store:
+            records = self.search([(field_name, "in", list(addresses))])
+            for record in records:
+                res[record[field_name]] |= record
+            return res
+        # No normalized email available: fall back to case insensitive matches,
+        # which can't use an index
+        field_name = self._primary_email
+        records = self.search(
+            expression.OR([[(field_name, "=ilike", x)] for x in addresses])
+        )
+        for record in records:
+            res[email_address_normalize(record[field_name])] |= record
+        return res
+
+    @api.model
+    def _email_bounced_propagate(self, bounces):
+        """Flag as bounced the records using the addresses of several bounces
+        with a single lookup and a single write.
+
+        :param bounces: list of (address, tracking_emails, reason, event)
+        :return: the bounced records
+        """
+        records_by_address = self._email_bounced_search([x[0] for x in bounces])
+        groups = defaultdict(self.browse)
+        for address, tracking_emails, reason, event in bounces:
+            records = records_by_address.get(email_address_normalize(address))
+            if records:
+                groups[(tracking_emails, reason, event or None)] |= records
+        bounced = self.browse()
+        for records in groups.values():
+            bounced |= records
+        if not bounced:
+            return bounced
+        bounced.filtered(lambda r: not r.email_bounced).write({"email_bounced": True})
+        for (tracking_emails, reason, event), records in groups.items():
+            records.email_bounced_set(tracking_emails, reason, event=event)
+        return bounced
+
+    def _email_bounced_lookup(self, emails):
+        """Return the last bounced tracking of several addresses with a single
+        query
+
+        :return: dictionary {address: mail.tracking.email}, only with the
+          bounced addresses
+        """
+        mte_obj = self.env["mail.tracking.email"]
+        states = mte_obj.sudo()._email_last_tracking_states(emails)
+        return {
+            address: mte_obj.browse(res["id"])
+            for address, res in states.items()
+            if res["state"] in BOUNCED_STATES
+        }
+
+    def _email_bounced_notify(self, tracking):
+        event = tracking.tracking_event_ids[:1]
+        self.with_context(write_loop=True).email_bounced_set(
+            tracking, event.error_details, event
+        )
+
+    def _email_bounced_get(self, email):
+        """Last bounced tracking of a normalized address, taken from the
+        lookups already done for a whole batch when available
+        """
+        prefetched = self.env.context.get("mail_bounced_prefetch")
+        if prefetched is not None and email in prefetched["addresses"]:
+            return prefetched["bounced"].get(email)
+        return self._email_bounced_lookup([email]).get(email)
+
+    def _load_records(self, data_list, update=False):
+        """Look up at once the addresses written by an import, which writes
+        the existing records one by one
+        """
+        email_field = self._primary_email
+        addresses = {
+            email_address_normalize(data["values"].get(email_field))
+            for data in data_list
+        } - {False}
+        if not addresses:
+            return super()._load_records(data_list, update=update)
+        prefetch = {
+            "addresses": addresses,
+            "bounced": self._email_bounced_lookup(addresses),
+        }
+        return super(
+            MailBouncedMixin, self.with_context(mail_bounced_prefetch=prefetch)
+        )._load_records(data_list, update=update)
+
     def write(self, vals):
         email_field = self._primary_email
         if email_field not in vals:
             return super().write(vals)
-        email = vals[email_field].lower() if vals[email_field] else False
-        mte_obj = self.env["mail.tracking.email"]
-        vals["email_bounced"] = mte_obj.email_is_bounced(email)
-        if vals["email_bounced"]:
-            res = mte_obj._email_last_tracking_state(email)
-            tracking = mte_obj.browse(res[0].get("id"))
-            event = tracking.tracking_event_ids[:1]
-            self.with_context(write_loop=True).email_bounced_set(
-                tracking, event.error_details, event
-            )
+        email = email_address_normalize(vals[email_field])
+        tracking = self._email_bounced_get(email) if email else False
+        vals["email_bounced"] = bool(tracking)
+        if tracking:
+            self._email_bounced_notify(tracking)
         return super().write(vals)
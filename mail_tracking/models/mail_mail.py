@@ -5,7 +5,7 @@ import time
 from datetime import datetime
 from email.utils import COMMASPACE
 
-from odoo import fields, models
+from odoo import fields, models, tools
 
 
 class MailMail(models.Model):
@@ -28,14 +28,80 @@ class MailMail(models.Model):
             "sender": self.email_from,
         }
 
+    def _tracking_email_to_get(self, partner=None):
+        """Recipients list as computed by ``_send_prepare_values``"""
+        if partner:
+            emails_normalized = tools.email_normalize_all(partner.email)
+            if emails_normalized:
+                return [
+                    tools.formataddr((partner.name or "False", email or "False"))
+                    for email in emails_normalized
+                ]
+            return [
+                tools.formataddr((partner.name or "False", partner.email or "False"))
+            ]
+        return tools.email_split_and_format(self.email_to)
+
+    def _tracking_emails_preallocate(self):
+        """Create in bulk the mail.tracking.email records of all the emails
+        that are going to be sent, with their final recipient, so sending them
+        doesn't write them again.
+
+        Trackings of emails that are never sent, e.g. when a worker crashes
+        after an intermediate commit, are removed by
+        ``_gc_preallocated_trackings``.
+
+        :return: dictionary {(mail_id, partner_id): tracking_email_id}
+        """
+        keys, vals_list = [], []
+        for mail in self.filtered(lambda x: x.state == "outgoing"):
+            partners = [None] if mail.email_to else []
+            partners += list(mail.recipient_ids)
+            for partner in partners:
+                email = {"email_to": mail._tracking_email_to_get(partner)}
+                keys.append((mail.id, partner.id if partner else False))
+                vals_list.append(mail._tracking_email_prepare(partner, email))
+        trackings = self.env["mail.tracking.email"].sudo().create(vals_list)
+        return dict(zip(keys, trackings.ids))
+
+    def _send(self, auto_commit=False, raise_exception=False, smtp_session=None):
+        preallocated = self._tracking_emails_preallocate()
+        try:
+            return super(
+                MailMail, self.with_context(mail_tracking_preallocated=preallocated)
+            )._send(
+                auto_commit=auto_commit,
+                raise_exception=raise_exception,
+                smtp_session=smtp_session,
+            )
+        finally:
+            # Remove the trackings of the emails that haven't been sent at all
+            if preallocated:
+                self.env["mail.tracking.email"].sudo().browse(
+                    preallocated.values()
+                ).exists().unlink()
+
     def _send_prepare_values(self, partner=None):
         """Creates the mail.tracking.email record and adds the image tracking
         to the email. Please note that because we can't add mail headers in this
         function, the added tracking image will later (IrMailServer.build_email)
         also be used to extract the mail.tracking.email record id and to set the
         X-Odoo-MailTracking-ID header there.
+
+        When the trackings have been created in bulk before sending, the
+        corresponding one is used instead, and only written if its recipient
+        differs from the one actually used.
         """
         email = super()._send_prepare_values(partner=partner)
         vals = self._tracking_email_prepare(partner, email)
-        tracking_email = self.env["mail.tracking.email"].sudo().create(vals)
+        preallocated = self.env.context.get("mail_tracking_preallocated") or {}
+        tracking_id = preallocated.pop(
+            (self.id, partner.id if partner else False), None
+        )
+        if tracking_id:
+            tracking_email = self.env["mail.tracking.email"].sudo().browse(tracking_id)
+            if tracking_email.recipient != vals["recipient"]:
+                tracking_email.recipient = vals["recipient"]
+        else:
+            tracking_email = self.env["mail.tracking.email"].sudo().create(vals)
         return tracking_email.tracking_img_add(email)
@@ -2,9 +2,10 @@
 # Copyright 2019 Alexandre Díaz
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
 
+from collections import defaultdict
 from email.utils import getaddresses
 
-from odoo import _, api, fields, models
+from odoo import _, api, fields, models, tools
 from odoo.osv import expression
 from odoo.tools import email_split
 
@@ -27,62 +28,84 @@ class MailMessage(models.Model):
         help="The message tracking will be considered to filter tracking issues",
         default=False,
     )
+    mail_tracking_failed = fields.Boolean(
+        compute="_compute_mail_tracking_failed",
+        store=True,
+        help="The message has failed trackings and needs action",
+    )
     is_failed_message = fields.Boolean(
         compute="_compute_is_failed_message",
         search="_search_is_failed_message",
     )
 
+    def init(self):
+        res = super().init()
+        # Only a tiny part of the messages are failed ones
+        tools.create_index(
+            self._cr,
+            "mail_message_mail_tracking_failed_index",
+            self._table,
+            ["id"],
+            where="mail_tracking_failed",
+        )
+        return res
+
     @api.model
     def get_failed_states(self):
         """The 'failed' states of the message"""
         return {"error", "rejected", "spam", "bounced", "soft-bounced"}
 
-    @api.depends(
-        "mail_tracking_needs_action",
-        "author_id",
-        "notification_ids",
-        "mail_tracking_ids",
-        "mail_tracking_ids.state",
-    )
+    @api.depends("mail_tracking_needs_action", "mail_tracking_ids.state")
+    def _compute_mail_tracking_failed(self):
+        failed_states = self.get_failed_states()
+        for message in self:
+            message.mail_tracking_failed = bool(
+                message.mail_tracking_needs_action
+                and failed_states.intersection(
+                    message.sudo().mapped("mail_tracking_ids.state")
+                )
+            )
+
+    @api.depends("mail_tracking_failed", "author_id", "notification_ids")
     def _compute_is_failed_message(self):
         """Compute 'is_failed_message' field for the active user"""
-        failed_states = self.get_failed_states()
         for message in self:
-            needs_action = message.mail_tracking_needs_action
             involves_me = self.env.user.partner_id in (
                 message.author_id | message.notification_ids.mapped("res_partner_id")
             )
-            has_failed_trackings = failed_states.intersection(
-                message.mapped("mail_tracking_ids.state")
-            )
             message.is_failed_message = bool(
-                needs_action and involves_me and has_failed_trackings
+                message.mail_tracking_failed and involves_me
             )
 
     def _search_is_failed_message(self, operator, value):
         """Search for messages considered failed for the active user.
         Be notice that 'notificacion_ids' is a record that change if
         the user mark the message as readed.
+
+        Only the messages flagged as failed are looked up, so the cost doesn't
+        depend on the number of messages notified to the user.
         """
+        partner_id = self.env.user.partner_id.id
         # FIXME: Due to ORM issue with auto_join and 'OR' we construct the domain
         # using an extra query to get valid results.
         # For more information see: https://github.com/odoo/odoo/issues/25175
-        notification_partner_ids = self.search(
-            [("notification_ids.res_partner_id", "=", self.env.user.partner_id.id)]
+        notified_ids = self._search(
+            [
+                ("mail_tracking_failed", "=", True),
+                ("notification_ids.res_partner_id", "=", partner_id),
+            ]
         )
-        return expression.normalize_domain(
+        domain = expression.normalize_domain(
             [
-                (
-                    "mail_tracking_ids.state",
-                    "in" if value else "not in",
-                    list(self.get_failed_states()),
-                ),
-                ("mail_tracking_needs_action", "=", True),
+                ("mail_tracking_failed", "=", True),
                 "|",
-                ("author_id", "=", self.env.user.partner_id.id),
-                ("id", "in", notification_partner_ids.ids),
+                ("author_id", "=", partner_id),
+                ("id", "in", notified_ids),
             ]
         )
+        if (operator == "=") != bool(value):
+            domain = ["!"] + domain
+        return domain
 
     def _tracking_status_map_get(self):
         """Map tracking states to be used in chatter"""
@@ -127,31 +150,68 @@ class MailMessage(models.Model):
         descriptions = {"no_recipient": _("The partner doesn't have a defined email")}
         return descriptions.get(tracking.error_type, tracking.error_description)
 
+    def _tracking_status_trackings_get(self):
+        """Fetch the trackings of all the messages at once, grouped by message"""
+        trackings = (
+            self.env["mail.tracking.email"]
+            .sudo()
+            .search([("mail_message_id", "in", self.ids)])
+        )
+        trackings_by_message = defaultdict(list)
+        for tracking in trackings:
+            trackings_by_message[tracking.mail_message_id.id].append(tracking)
+        return trackings_by_message
+
+    def _tracking_status_partners_get(self, emails):
+        """Fetch the partners of all the To/Cc recipients at once"""
+        if not emails:
+            return self.env["res.partner"]
+        return self.env["res.partner"].search([("email", "in", list(emails))])
+
     def tracking_status(self):
-        """Generates a complete status tracking of the messages by partner"""
+        """Generates a complete status tracking of the messages by partner
+
+        Trackings and recipient partners are fetched for the whole recordset in
+        a constant number of queries and then assembled message by message.
+        """
         res = {}
+        if not self:
+            return res
+        trackings_by_message = self._tracking_status_trackings_get()
+        # String to List
+        recipients_by_message = {}
+        for message in self:
+            recipients_by_message[message.id] = (
+                self._drop_aliases(email_split(message.email_cc)),
+                self._drop_aliases(email_split(message.email_to)),
+            )
+        all_emails = set()
+        for email_cc_list, email_to_list in recipients_by_message.values():
+            all_emails.update(email_cc_list + email_to_list)
+        recipient_partners = self._tracking_status_partners_get(all_emails)
+        # Default tracking values
+        tracking_unknown_values = {
+            "status": "unknown",
+            "status_human": self._partner_tracking_status_human_get("unknown"),
+            "error_type": False,
+            "error_description": False,
+            "tracking_id": False,
+        }
         for message in self:
             tracking_delta = 0
             partner_trackings = []
             partners_already = self.env["res.partner"]
-            partners = self.env["res.partner"]
-            trackings = (
-                self.env["mail.tracking.email"]
-                .sudo()
-                .search([("mail_message_id", "=", message.id)])
-            )
-            # String to List
-            email_cc_list = self._drop_aliases(email_split(message.email_cc))
-            email_to_list = self._drop_aliases(email_split(message.email_to))
-            # Search related partners recipients
-            partners |= partners.search(
-                [("email", "in", email_cc_list + email_to_list)]
+            email_cc_list, email_to_list = recipients_by_message[message.id]
+            # Related partners recipients
+            message_emails = set(email_cc_list + email_to_list)
+            partners = recipient_partners.filtered(
+                lambda p, emails=message_emails: p.email in emails
             )
             # Operate over set's instead of lists
             email_cc_list = set(email_cc_list)
             email_to_list = set(email_to_list) - email_cc_list
-            # Search all trackings for this message
-            for tracking in trackings:
+            # All trackings for this message
+            for tracking in trackings_by_message.get(message.id, []):
                 status = self._partner_tracking_status_get(tracking)
                 recipient = tracking.partner_id.name or tracking.recipient
                 partner_trackings.append(
@@ -180,14 +240,6 @@ class MailMessage(models.Model):
                 partners |= message.notified_partner_ids
             # Discard partner recipients already included
             partners -= partners_already
-            # Default tracking values
-            tracking_unknown_values = {
-                "status": "unknown",
-                "status_human": self._partner_tracking_status_human_get("unknown"),
-                "error_type": False,
-                "error_description": False,
-                "tracking_id": False,
-            }
             # Process tracking status of partner recipients without tracking
             for partner in partners:
                 # Discard 'To' with partner
@@ -23,11 +23,7 @@ class MailThread(models.AbstractModel):
     def _get_failed_message_domain(self):
         """Domain used to display failed messages on the 'failed_messages'
         widget"""
-        failed_states = self.env["mail.message"].get_failed_states()
-        return [
-            ("mail_tracking_needs_action", "=", True),
-            ("mail_tracking_ids.state", "in", list(failed_states)),
-        ]
+        return [("mail_tracking_failed", "=", True)]
 
     @api.model
     def _message_route_process(self, message, message_dict, routes):
@@ -115,18 +111,7 @@ class MailThread(models.AbstractModel):
                     "string": _("Failed sent messages"),
                     "name": "failed_message_ids",
                     "domain": str(
-                        [
-                            [
-                                "failed_message_ids.mail_tracking_ids.state",
-                                "in",
-                                list(self.env["mail.message"].get_failed_states()),
-                            ],
-                            [
-                                "failed_message_ids.mail_tracking_needs_action",
-                                "=",
-                                True,
-                            ],
-                        ]
+                        [["failed_message_ids.mail_tracking_failed", "=", True]]
                     ),
                 },
             )
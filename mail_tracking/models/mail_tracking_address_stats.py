@@ -0,0 +1,133 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+import logging
+from collections import defaultdict
+
+from odoo import api, fields, models, tools
+
+_logger = logging.getLogger(__name__)
+
+
+class MailTrackingAddressStats(models.Model):
+    """Per recipient address and state counters of mail.tracking.email.
+
+    They are incrementally maintained from the trackings create, write and
+    unlink so the email reputation of an address can be read without
+    aggregating the whole tracking table.
+    """
+
+    _name = "mail.tracking.address.stats"
+    _description = "MailTracking address statistics"
+    _order = "recipient_address, state"
+    _rec_name = "recipient_address"
+    _log_access = False
+
+    recipient_address = fields.Char(readonly=True, required=True, index=True)
+    state = fields.Selection(selection="_selection_state", readonly=True)
+    count = fields.Integer(readonly=True)
+
+    @api.model
+    def _selection_state(self):
+        return self.env["mail.tracking.email"]._fields["state"].selection
+
+    def init(self):
+        tools.create_unique_index(
+            self._cr,
+            "mail_tracking_address_stats_address_state_uniq",
+            self._table,
+            ["recipient_address", "COALESCE(state, '')"],
+        )
+
+    @api.model
+    def _stats_update(self, deltas):
+        """Apply counter deltas
+
+        The rows are always updated in the same order, so concurrent
+        transactions updating the same addresses can't deadlock.
+
+        :param deltas: dictionary {(recipient_address, state): delta}
+        """
+        increments, decrements = [], []
+        for (address, state), delta in sorted(
+            deltas.items(), key=lambda x: (x[0][0] or "", x[0][1] or "")
+        ):
+            if not address or not delta:
+                continue
+            if delta > 0:
+                increments.append((address, state or None, delta))
+            else:
+                decrements.append((address, state or None, -delta))
+        if increments:
+            addresses, states, counts = zip(*increments)
+            self.env.cr.execute(
+                """
+                INSERT INTO mail_tracking_address_stats (recipient_address, state, count)
+                SELECT * FROM unnest(%s::varchar[], %s::varchar[], %s::integer[])
+                ON CONFLICT (recipient_address, COALESCE(state, ''))
+                DO UPDATE SET count = mail_tracking_address_stats.count + EXCLUDED.count
+                """,
+                (list(addresses), list(states), list(counts)),
+            )
+        if decrements:
+            addresses, states, counts = zip(*decrements)
+            self.env.cr.execute(
+                """
+                UPDATE mail_tracking_address_stats stats
+                SET count = GREATEST(stats.count - delta.count, 0)
+                FROM unnest(%s::varchar[], %s::varchar[], %s::integer[])
+                    AS delta(recipient_address, state, count)
+                WHERE stats.recipient_address = delta.recipient_address
+                    AND COALESCE(stats.state, '') = COALESCE(delta.state, '')
+                """,
+                (list(addresses), list(states), list(counts)),
+            )
+        if increments or decrements:
+            self.invalidate_model()
+
+    @api.model
+    def _stats_get(self, addresses):
+        """Return the counters of the given addresses in a single query
+
+        :return: dictionary {recipient_address: {state: count}}
+        """
+        res = defaultdict(dict)
+        addresses = {x for x in addresses if x}
+        if not addresses:
+            return res
+        self.env.cr.execute(
+            """
+            SELECT recipient_address, state, count
+            FROM mail_tracking_address_stats
+            WHERE recipient_address IN %s AND count > 0
+            """,
+            (tuple(addresses),),
+        )
+        for address, state, count in self.env.cr.fetchall():
+            res[address][state or False] = count
+        return res
+
+    @api.model
+    def _rebuild(self):
+        """Recompute all the counters from the tracking and archive tables.
+
+        Meant to be run once on existing databases or after any direct SQL
+        manipulation of mail_tracking_email.
+        """
+        self.env["mail.tracking.email"].flush_model(["recipient_address", "state"])
+        _logger.info("Rebuilding mail tracking address statistics")
+        self.env.cr.execute("DELETE FROM mail_tracking_address_stats")
+        self.env.cr.execute(
+            """
+            INSERT INTO mail_tracking_address_stats (recipient_address, state, count)
+            SELECT recipient_address, state, COUNT(*)
+            FROM (
+                SELECT recipient_address, state FROM mail_tracking_email
+                UNION ALL
+                SELECT recipient_address, state FROM mail_tracking_email_archive
+            ) AS tracking
+            WHERE recipient_address IS NOT NULL
+            GROUP BY recipient_address, state
+            """
+        )
+        self.invalidate_model()
+        return True
@@ -0,0 +1,44 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+from odoo import api, fields, models, tools
+
+
+class MailTrackingCheckpoint(models.Model):
+    """Progress of the crons processing the tracking data by batches.
+
+    Checkpoints are saved after every batch, so they are not stored as system
+    parameters, whose writes clear the caches of every worker.
+    """
+
+    _name = "mail.tracking.checkpoint"
+    _description = "MailTracking cron checkpoint"
+    _order = "name"
+    _log_access = False
+
+    name = fields.Char(readonly=True, required=True)
+    value = fields.Char(readonly=True)
+
+    def init(self):
+        tools.create_unique_index(
+            self._cr, "mail_tracking_checkpoint_name_uniq", self._table, ["name"]
+        )
+
+    @api.model
+    def _checkpoint_get(self, name, default=False):
+        self.flush_model()
+        self.env.cr.execute(
+            "SELECT value FROM mail_tracking_checkpoint WHERE name = %s", (name,)
+        )
+        row = self.env.cr.fetchone()
+        return row[0] if row and row[0] is not None else default
+
+    @api.model
+    def _checkpoint_set(self, name, value):
+        self.env.cr.execute(
+            """
+            INSERT INTO mail_tracking_checkpoint (name, value) VALUES (%s, %s)
+            ON CONFLICT (name) DO UPDATE SET value = EXCLUDED.value
+            """,
+            (name, str(value)),
+        )
+        self.invalidate_model()
@@ -2,21 +2,36 @@
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
 
 import logging
-import re
 import time
 import urllib.parse
 import uuid
-from datetime import datetime
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
 
 from odoo import _, api, fields, models, tools
 from odoo.exceptions import AccessError
 from odoo.fields import Command
-from odoo.tools import email_split
+from odoo.osv import expression
+
+from ..tools import TTLCache, email_address_normalize, tracking_img_remove
 
 _logger = logging.getLogger(__name__)
 
 EVENT_OPEN_DELTA = 10  # seconds
 EVENT_CLICK_DELTA = 5  # seconds
+# In-process window of recently created open/click events, used to discard
+# concurrent ones without querying the database
+EVENT_CACHE_SIZE = 10000  # keys
+EVENT_CACHE_TTL = 60  # seconds
+# Transaction data key of the events waiting to be added to the cache
+EVENT_CACHE_PENDING = "mail.tracking.email.concurrent_events"
+# Optional in-process cache of the last tracking state of the addresses,
+# enabled by setting mail_tracking.address_state_cache_ttl (seconds)
+ADDRESS_STATE_CACHE_SIZE = 100000  # addresses
+# Trackings created before sending and still without state after this delay
+# belong to emails whose sending was interrupted
+PREALLOCATED_GC_DELAY = 1  # days
+BOUNCED_STATES = {"rejected", "error", "spam", "bounced"}
 
 
 class MailTrackingEmail(models.Model):
@@ -124,6 +139,14 @@ class MailTrackingEmail(models.Model):
         for tracking in self.filtered("mail_message_id"):
             tracking.message_id = tracking.mail_message_id.message_id
 
+    def _address_stats_keys(self):
+        """Keys of the trackings in mail.tracking.address.stats"""
+        return Counter(
+            (tracking.recipient_address, tracking.state)
+            for tracking in self
+            if tracking.recipient_address
+        )
+
     @api.model_create_multi
     def create(self, vals_list):
         records = super().create(vals_list)
@@ -131,48 +154,116 @@ class MailTrackingEmail(models.Model):
         records.filtered(lambda one: one.state in failed_states).mapped(
             "mail_message_id"
         ).write({"mail_tracking_needs_action": True})
+        self.env["mail.tracking.address.stats"]._stats_update(
+            records._address_stats_keys()
+        )
+        records._address_state_cache_discard()
         return records
 
     def write(self, vals):
+        stats_changed = "state" in vals or "recipient" in vals
+        if stats_changed:
+            old_keys = self._address_stats_keys()
+            self._address_state_cache_discard()
         res = super().write(vals)
         state = vals.get("state")
         if state and state in self.env["mail.message"].get_failed_states():
             self.mapped("mail_message_id").write({"mail_tracking_needs_action": True})
+        if stats_changed:
+            deltas = self._address_stats_keys()
+            deltas.subtract(old_keys)
+            self.env["mail.tracking.address.stats"]._stats_update(deltas)
+            self._address_state_cache_discard()
         return res
 
+    def unlink(self):
+        deltas = Counter()
+        deltas.subtract(self._address_stats_keys())
+        res = super().unlink()
+        self.env["mail.tracking.address.stats"]._stats_update(deltas)
+        return res
+
+    @api.autovacuum
+    def _gc_preallocated_trackings(self):
+        """Remove the trackings created before sending emails that were never
+        sent, e.g. when a worker crashed after an intermediate commit.
+        """
+        limit = fields.Datetime.now() - timedelta(days=PREALLOCATED_GC_DELAY)
+        self.sudo().search(
+            [
+                ("state", "=", False),
+                ("tracking_event_ids", "=", False),
+                ("create_date", "<", limit),
+            ]
+        ).unlink()
+
+    @api.model
+    @tools.ormcache()
+    def _mail_thread_models(self):
+        return tuple(
+            model_name
+            for model_name, model in self.pool.items()
+            if issubclass(model, self.pool["mail.thread"])
+            and not model._abstract
+            and not model._transient
+        )
+
+    @api.model
+    def _allowed_message_models(self):
+        """Models whose messages can be linked to trackings"""
+        return [
+            model_name
+            for model_name in self._mail_thread_models()
+            if self.env[model_name].check_access_rights("read", raise_exception=False)
+        ]
+
+    @api.model
+    def _allowed_domain(self):
+        """Trackings ACL, based on related records ACLs, as a domain.
+
+        A tracking can be read if we can read the linked message, or the linked
+        partner when there's no linked message, or if there's no linked record
+        at all. The readable messages and partners are expressed as subqueries,
+        so the whole filter is done by the database in the search query.
+        """
+        if self.env.su or self.env.user.has_group("base.group_system"):
+            return []
+        partner = self.env.user.partner_id
+        message_domain = expression.OR(
+            [
+                [("author_id", "=", partner.id)],
+                [("partner_ids", "in", partner.ids)],
+                [("notification_ids.res_partner_id", "=", partner.id)],
+            ]
+            + [
+                [
+                    ("model", "=", model_name),
+                    ("res_id", "in", self.env[model_name]._search([])),
+                ]
+                for model_name in self._allowed_message_models()
+            ]
+        )
+        message_obj = self.env["mail.message"]
+        if not self.env.user._is_internal():
+            message_domain = expression.AND(
+                [message_domain, message_obj._get_search_domain_share()]
+            )
+        message_query = message_obj.sudo()._search(message_domain)
+        partner_query = self.env["res.partner"]._search([])
+        return expression.OR(
+            [
+                [("mail_message_id", "in", message_query)],
+                [("mail_message_id", "=", False), ("partner_id", "in", partner_query)],
+                [("mail_message_id", "=", False), ("partner_id", "=", False)],
+            ]
+        )
+
     def _find_allowed_tracking_ids(self):
         """Filter trackings based on related records ACLs"""
         # Admins passby this filter
         if not self or self.env.user.has_group("base.group_system"):
             return self.ids
-        # Override ORM to get the values directly
-        self._cr.execute(
-            """
-            SELECT id, mail_message_id, partner_id
-            FROM mail_tracking_email WHERE id IN %s
-            """,
-            (tuple(self.ids),),
-        )
-        msg_linked = self._cr.fetchall()
-        if not msg_linked:
-            return []
-        _, msg_ids, partner_ids = zip(*msg_linked)
-        # Filter messages with their ACL rules avoiding False values fetched in the set
-        msg_ids = self.env["mail.message"]._search(
-            [("id", "in", [x for x in msg_ids if x])]
-        )
-        partner_ids = self.env["res.partner"]._search(
-            [("id", "in", [x for x in partner_ids if x])]
-        )
-        return [
-            track_id
-            for track_id, mail_msg_id, partner_id in msg_linked
-            if (mail_msg_id in msg_ids)  # We can read the linked message
-            or (
-                not mail_msg_id and partner_id in partner_ids
-            )  # No linked mail.message but we can read the linked partner
-            or (not any({mail_msg_id, partner_id}))  # No linked record
-        ]
+        return list(self._search([("id", "in", self.ids)]))
 
     @api.model
     def _search(
@@ -185,18 +276,20 @@ class MailTrackingEmail(models.Model):
         access_rights_uid=None,
     ):
         """Filter ids based on related records ACLs"""
-        ids = super()._search(
+        allowed_domain = self._allowed_domain()
+        if allowed_domain:
+            args = expression.AND([args or [], allowed_domain])
+        return super()._search(
             args, offset, limit, order, count=count, access_rights_uid=access_rights_uid
         )
-        if not self.env.user.has_group("base.group_system") and not count:
-            ids = self.browse(ids)._find_allowed_tracking_ids()
-        return ids
 
     def check_access_rule(self, operation):
         """Rely on related messages ACLs"""
         super().check_access_rule(operation)
-        allowed_ids = self._search([("id", "in", self._find_allowed_tracking_ids())])
-        disallowed_ids = set(self.exists().ids).difference(set(allowed_ids))
+        if not self._allowed_domain():
+            return
+        allowed_ids = set(self._search([("id", "in", self.ids)]))
+        disallowed_ids = set(self.exists().ids).difference(allowed_ids)
         if not disallowed_ids:
             return
         raise AccessError(
@@ -224,33 +317,107 @@ class MailTrackingEmail(models.Model):
         if not email:
             return False
         res = self.sudo()._email_last_tracking_state(email)
-        return res and res[0].get("state", "") in {
-            "rejected",
-            "error",
-            "spam",
-            "bounced",
-        }
+        return bool(res) and res[0].get("state", "") in BOUNCED_STATES
 
     @api.model
     def _email_last_tracking_state(self, email):
-        return self.search_read(
-            [("recipient_address", "=", email.lower())],
-            ["state"],
-            limit=1,
-            order="time DESC",
+        res = self._email_last_tracking_states([email]).get(
+            email_address_normalize(email)
         )
+        return [res] if res else []
+
+    @api.model
+    def _address_state_cache(self):
+        """Registry level cache of the last tracking state of the addresses,
+        or None when it is disabled.
+        """
+        ttl = int(
+            self.env["ir.config_parameter"]
+            .sudo()
+            .get_param("mail_tracking.address_state_cache_ttl", 0)
+            or 0
+        )
+        if ttl <= 0:
+            return None
+        registry = self.env.registry
+        cache = getattr(registry, "_mail_tracking_address_state_cache", None)
+        if cache is None or cache.ttl != ttl:
+            cache = registry._mail_tracking_address_state_cache = TTLCache(
+                ADDRESS_STATE_CACHE_SIZE, ttl
+            )
+        return cache
+
+    def _address_state_cache_discard(self):
+        """Forget the cached state of the addresses of the trackings, now and
+        once the transaction is committed so no other request caches the
+        state read before it.
+        """
+        cache = getattr(self.env.registry, "_mail_tracking_address_state_cache", None)
+        if cache is None:
+            return
+        addresses = {x for x in self.sudo().mapped("recipient_address") if x}
+
+        def discard():
+            for address in addresses:
+                cache.discard(address)
+
+        discard()
+        self.env.cr.postcommit.add(discard)
+
+    @api.model
+    def _email_last_tracking_states(self, emails):
+        """Return the state of the last tracking of several addresses with a
+        single query, regardless of the access rights.
+
+        :return: dictionary {address: {"id": tracking id, "state": state}},
+          without the addresses having no tracking
+        """
+        emails = {email_address_normalize(x) for x in emails} - {False}
+        res = {}
+        cache = self._address_state_cache()
+        if cache is not None:
+            for email in list(emails):
+                # Addresses without any tracking are cached as False
+                value = cache.get(email)
+                cache.count(value is not None)
+                if value is not None:
+                    emails.discard(email)
+                    if value:
+                        res[email] = dict(value)
+        if not emails:
+            return res
+        self.flush_model(["recipient_address", "state", "time"])
+        self.env.cr.execute(
+            """
+            SELECT DISTINCT ON (recipient_address) recipient_address, id, state
+            FROM mail_tracking_email
+            WHERE recipient_address IN %s
+            ORDER BY recipient_address, time DESC, id DESC
+            """,
+            (tuple(emails),),
+        )
+        found = {
+            address: {"id": tracking_id, "state": state}
+            for address, tracking_id, state in self.env.cr.fetchall()
+        }
+        res.update(found)
+        if cache is not None:
+            for email in emails:
+                cache.set(email, found.get(email, False))
+        return res
 
     @api.model
     def email_score_from_email(self, email):
         if not email:
             return 0.0
-        data = self.sudo().read_group(
-            [("recipient_address", "=", email.lower())],
-            ["recipient_address", "state"],
-            ["state"],
-        )
-        mapped_data = {state["state"]: state["state_count"] for state in data}
-        return self.with_context(mt_states=mapped_data).sudo().email_score()
+        email = email_address_normalize(email)
+        stats = self.env["mail.tracking.address.stats"].sudo()._stats_get([email])
+        return self._email_score_from_states(stats.get(email, {}))
+
+    @api.model
+    def _email_score_from_states(self, states):
+        """Email score from a {state: count} dictionary"""
+        return self.browse().with_context(mt_states=states).sudo().email_score()
 
     @api.model
     def _email_score_weights(self):
@@ -292,10 +459,7 @@ class MailTrackingEmail(models.Model):
     @api.depends("recipient")
     def _compute_recipient_address(self):
         for email in self:
-            email.recipient_address = False
-            recipient_email = email_split(email.recipient)
-            if recipient_email:
-                email.recipient_address = recipient_email[0].lower()
+            email.recipient_address = email_address_normalize(email.recipient)
 
     @api.depends("name", "recipient")
     def _compute_tracking_display_name(self):
@@ -329,16 +493,18 @@ class MailTrackingEmail(models.Model):
         _logger.debug(f"Sending email will tracking url: {track_url}")
         return f'<img src="{track_url}" alt="" data-odoo-tracking-email="{self.id}"/>'
 
-    def _partners_email_bounced_set(self, reason, event=None):
-        recipients = []
+    def _bounced_addresses(self, event=None):
         if event and event.recipient_address:
-            recipients.append(event.recipient_address)
-        else:
-            recipients = [x for x in self.mapped("recipient_address") if x]
-        for recipient in recipients:
-            self.env["res.partner"].search(
-                [("email", "=ilike", recipient)]
-            ).email_bounced_set(self, reason, event=event)
+            return [event.recipient_address]
+        return [x for x in self.mapped("recipient_address") if x]
+
+    def _partners_email_bounced_set(self, reason, event=None):
+        self.env["res.partner"]._email_bounced_propagate(
+            [
+                (address, self, reason, event)
+                for address in self._bounced_addresses(event)
+            ]
+        )
 
     def smtp_error(self, mail_server, smtp_server, exception):
         values = {"state": "error"}
@@ -369,9 +535,7 @@ class MailTrackingEmail(models.Model):
         tracking_url = self._get_mail_tracking_img()
         if tracking_url:
             content = email.get("body", "")
-            content = re.sub(
-                r'<img[^>]*data-odoo-tracking-email=["\'][0-9]*["\'][^>]*>', "", content
-            )
+            content = tracking_img_remove(content)
             body = tools.append_content_to_html(
                 content, tracking_url, plaintext=False, container_tag="div"
             )
@@ -439,24 +603,191 @@ class MailTrackingEmail(models.Model):
             concurrent_event_ids = m_event.search(domain)
         return concurrent_event_ids
 
-    def event_create(self, event_type, metadata):
-        event_ids = self.env["mail.tracking.event"]
-        for tracking_email in self:
-            other_ids = tracking_email._concurrent_events(event_type, metadata)
-            if not other_ids:
-                vals = tracking_email._event_prepare(event_type, metadata)
-                if vals:
-                    events = event_ids.sudo().create(vals)
-                    if event_type in {"hard_bounce", "spam", "reject"}:
-                        for event in events:
-                            self.sudo()._partners_email_bounced_set(
-                                event_type, event=event
-                            )
-                    event_ids += events
-            else:
-                _logger.debug("Concurrent event '%s' discarded", event_type)
+    @api.model
+    def _concurrent_events_cache(self):
+        """Registry level cache of the last open and click timestamps, keyed on
+        (tracking_email_id, event_type, url).
+        """
+        registry = self.env.registry
+        try:
+            return registry._mail_tracking_concurrent_events_cache
+        except AttributeError:
+            cache = registry._mail_tracking_concurrent_events_cache = TTLCache(
+                EVENT_CACHE_SIZE, EVENT_CACHE_TTL
+            )
+            return cache
+
+    @api.model
+    def concurrent_events_cache_stats(self):
+        """Hit and miss counters of the concurrent events cache, for monitoring"""
+        return self._concurrent_events_cache().stats()
+
+    @api.model
+    def _concurrent_events_cache_add(self, events):
+        """Remember the open and click events once the transaction is committed
+
+        The events are only checked right before the commit, so the ones
+        created in a savepoint rolled back meanwhile are not cached.
+
+        :param events: just created mail.tracking.event records
+        """
+        events = events.filtered(lambda x: x.event_type in {"open", "click"})
+        if not events:
+            return
+        pending = self.env.cr.precommit.data.setdefault(EVENT_CACHE_PENDING, {})
+        if not pending:
+            self.env.cr.precommit.add(self._concurrent_events_cache_flush)
+        for event in events:
+            url = event.url if event.event_type == "click" else False
+            key = (event.tracking_email_id.id, event.event_type, url)
+            pending[event.id] = (key, event.timestamp)
+
+    @api.model
+    def _concurrent_events_cache_flush(self):
+        pending = self.env.cr.precommit.data.pop(EVENT_CACHE_PENDING, {})
+        events = self.env["mail.tracking.event"].sudo().browse(pending).exists()
+        keys = [pending[event_id] for event_id in events.ids]
+        if not keys:
+            return
+        cache = self._concurrent_events_cache()
+
+        @self.env.cr.postcommit.add
+        def _cache_add():
+            for key, ts in keys:
+                # Only the last few timestamps are needed to detect concurrency
+                cache.set(key, (cache.get(key, ()) + (ts,))[-5:])
+
+    @api.model
+    def _concurrent_events_filter(self, events):
+        """Discard the open and click events that are concurrent with already
+        existing ones, or with a previous event of the same batch.
+
+        Recent events are looked up first in the in-process cache, the
+        database is only searched for the cache misses.
+
+        :param events: list of (tracking, event_type, metadata) tuples
+        :return: the list of not concurrent events
+        """
+        concurrent_types = {"open", "click"}
+        cache = self._concurrent_events_cache()
+        known = defaultdict(list)
+        candidates = []
+        for tracking, event_type, metadata in events:
+            if event_type not in concurrent_types:
+                continue
+            ts = metadata.get("timestamp", time.time())
+            url = metadata.get("url", False) if event_type == "click" else False
+            key = (tracking.id, event_type, url)
+            delta = EVENT_OPEN_DELTA if event_type == "open" else EVENT_CLICK_DELTA
+            cached = cache.get(key, ())
+            hit = any(abs(ts - other) <= delta for other in cached)
+            cache.count(hit)
+            known[key].extend(cached)
+            if not hit:
+                candidates.append((tracking.id, event_type, ts))
+        if candidates:
+            # Fetch every event that could collide with any cache miss at once
+            delta = max(EVENT_OPEN_DELTA, EVENT_CLICK_DELTA)
+            timestamps = [ts for __, __, ts in candidates]
+            for event in (
+                self.env["mail.tracking.event"]
+                .sudo()
+                .search_read(
+                    [
+                        ("tracking_email_id", "in", list({x[0] for x in candidates})),
+                        ("event_type", "in", list({x[1] for x in candidates})),
+                        ("timestamp", ">=", min(timestamps) - delta),
+                        ("timestamp", "<=", max(timestamps) + delta),
+                    ],
+                    ["tracking_email_id", "event_type", "url", "timestamp"],
+                    load=None,
+                )
+            ):
+                url = event["url"] if event["event_type"] == "click" else False
+                key = (event["tracking_email_id"], event["event_type"], url)
+                known[key].append(event["timestamp"])
+        res = []
+        for tracking, event_type, metadata in events:
+            if event_type in concurrent_types:
+                ts = metadata.get("timestamp", time.time())
+                url = metadata.get("url", False) if event_type == "click" else False
+                key = (tracking.id, event_type, url)
+                delta = EVENT_OPEN_DELTA if event_type == "open" else EVENT_CLICK_DELTA
+                if any(abs(ts - other) <= delta for other in known[key]):
+                    _logger.debug("Concurrent event '%s' discarded", event_type)
+                    continue
+                known[key].append(ts)
+            res.append((tracking, event_type, metadata))
+        return res
+
+    @api.model
+    def _event_batch_flush(self, batch):
+        """Apply the tracking writes delayed while processing a batch of
+        events, with one write per distinct set of values.
+        """
+        trackings_by_vals = defaultdict(list)
+        for tracking_id, vals in batch["trackings"].items():
+            trackings_by_vals[tuple(sorted(vals.items()))].append(tracking_id)
+        for vals, tracking_ids in trackings_by_vals.items():
+            self.browse(tracking_ids).sudo().write(dict(vals))
+
+    @api.model
+    def _events_email_bounced_set(self, bounces):
+        """Propagate bounce events to the records using their email address
+
+        :param bounces: list of (address, tracking_email, reason, event)
+        """
+        self.env["res.partner"].sudo()._email_bounced_propagate(bounces)
+
+    @api.model
+    def event_create_batch(self, events):
+        """Create tracking events in bulk.
+
+        :param events: list of (tracking_email_id, event_type, metadata) tuples
+        :return: the created mail.tracking.event records
+        """
+        batch = {"trackings": {}}
+        trackings = self.with_context(mail_tracking_event_batch=batch).browse(
+            list({tracking_id for tracking_id, __, __ in events})
+        )
+        trackings_by_id = {tracking.id: tracking for tracking in trackings}
+        events = self._concurrent_events_filter(
+            [
+                (trackings_by_id[tracking_id], event_type, metadata)
+                for tracking_id, event_type, metadata in events
+            ]
+        )
+        vals_list = []
+        event_trackings = []
+        for tracking, event_type, metadata in events:
+            vals = tracking._event_prepare(event_type, metadata)
+            if vals:
+                vals_list.append(vals)
+                event_trackings.append(tracking)
+        self._event_batch_flush(batch)
+        event_ids = self.env["mail.tracking.event"].sudo().create(vals_list)
+        self._concurrent_events_cache_add(event_ids)
+        # Propagate bounces once per address
+        bounced = {}
+        for tracking, event in zip(event_trackings, event_ids):
+            if event.event_type not in {"hard_bounce", "spam", "reject"}:
+                continue
+            address = event.recipient_address or tracking.recipient_address
+            bounced.setdefault(address, (tracking, event))
+        if bounced:
+            self.sudo()._events_email_bounced_set(
+                [
+                    (address, self.sudo().browse(tracking.id), event.event_type, event)
+                    for address, (tracking, event) in bounced.items()
+                ]
+            )
         return event_ids
 
+    def event_create(self, event_type, metadata):
+        return self.event_create_batch(
+            [(tracking.id, event_type, metadata) for tracking in self]
+        )
+
     # TODO Remove useless method
     @api.model
     def event_process(self, request, post, metadata, event_type=None):
@@ -0,0 +1,201 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+import logging
+import threading
+
+from dateutil.relativedelta import relativedelta
+
+from odoo import api, fields, models
+
+_logger = logging.getLogger(__name__)
+
+# Number of trackings moved to the archive per transaction
+ARCHIVE_BATCH_SIZE = 10000
+
+
+class MailTrackingEmailArchive(models.Model):
+    """Compact copy of the trackings older than the retention policy.
+
+    Archived records keep the id they had in mail.tracking.email. They are
+    moved by SQL, so mail.tracking.address.stats still counts them and the
+    email score of the addresses doesn't change.
+    """
+
+    _name = "mail.tracking.email.archive"
+    _description = "MailTracking email archive"
+    _order = "time desc"
+    _log_access = False
+
+    name = fields.Char(string="Subject", readonly=True)
+    timestamp = fields.Float(
+        string="UTC timestamp", readonly=True, digits="MailTracking Timestamp"
+    )
+    time = fields.Datetime(readonly=True, index=True)
+    date = fields.Date(readonly=True)
+    mail_message_id = fields.Many2one(comodel_name="mail.message", readonly=True)
+    partner_id = fields.Many2one(
+        string="Partner", comodel_name="res.partner", readonly=True
+    )
+    recipient = fields.Char(string="Recipient email", readonly=True)
+    recipient_address = fields.Char(
+        string="Recipient email address", readonly=True, index=True
+    )
+    sender = fields.Char(string="Sender email", readonly=True)
+    state = fields.Selection(selection="_selection_state", readonly=True)
+    error_type = fields.Char(readonly=True)
+    error_description = fields.Char(readonly=True)
+    bounce_type = fields.Char(readonly=True)
+    bounce_description = fields.Char(readonly=True)
+    tracking_event_ids = fields.One2many(
+        string="Tracking events",
+        comodel_name="mail.tracking.event.archive",
+        inverse_name="tracking_email_id",
+        readonly=True,
+    )
+
+    @api.model
+    def _selection_state(self):
+        return self.env["mail.tracking.email"]._fields["state"].selection
+
+    @api.model
+    def _archive_columns(self):
+        """Columns copied from mail_tracking_email"""
+        return [
+            "id",
+            "name",
+            "timestamp",
+            "time",
+            "date",
+            "mail_message_id",
+            "partner_id",
+            "recipient",
+            "recipient_address",
+            "sender",
+            "state",
+            "error_type",
+            "error_description",
+            "bounce_type",
+            "bounce_description",
+        ]
+
+    @api.model
+    def _retention_months(self):
+        """Retention policy, read from the mail_tracking.retention_months
+        system parameter, that can be overriden for every state with
+        mail_tracking.retention_months.<state>. 0 means forever.
+
+        :return: dictionary {state: months}
+        """
+        icp = self.env["ir.config_parameter"].sudo()
+        default = int(icp.get_param("mail_tracking.retention_months", 0))
+        res = {False: default}
+        for state, __ in self._selection_state():
+            res[state] = int(
+                icp.get_param("mail_tracking.retention_months.%s" % state, default)
+            )
+        return res
+
+    @api.model
+    def _archive_ids(self, tracking_ids):
+        """Move the given trackings and their events to the archive, and
+        unflag the messages that have no failed tracking left.
+        """
+        columns = ", ".join(self._archive_columns())
+        event_columns = ", ".join(
+            self.env["mail.tracking.event.archive"]._archive_columns()
+        )
+        self.env.cr.execute(
+            f"""
+            INSERT INTO mail_tracking_email_archive ({columns})
+            SELECT {columns} FROM mail_tracking_email WHERE id = ANY(%s)
+            """,
+            (tracking_ids,),
+        )
+        self.env.cr.execute(
+            f"""
+            INSERT INTO mail_tracking_event_archive ({event_columns})
+            SELECT {event_columns} FROM mail_tracking_event
+            WHERE tracking_email_id = ANY(%s)
+            """,
+            (tracking_ids,),
+        )
+        # Events are removed by the foreign key cascade
+        self.env.cr.execute(
+            """
+            DELETE FROM mail_tracking_email WHERE id = ANY(%s)
+            RETURNING mail_message_id
+            """,
+            (tracking_ids,),
+        )
+        message_ids = list({row[0] for row in self.env.cr.fetchall() if row[0]})
+        if message_ids:
+            # As mail_message.mail_tracking_failed isn't recomputed by the ORM
+            self.env.cr.execute(
+                """
+                UPDATE mail_message message
+                SET mail_tracking_failed = FALSE
+                WHERE message.id = ANY(%s)
+                    AND message.mail_tracking_failed
+                    AND NOT EXISTS (
+                        SELECT 1 FROM mail_tracking_email tracking
+                        WHERE tracking.mail_message_id = message.id
+                            AND tracking.state IN %s
+                    )
+                """,
+                (
+                    message_ids,
+                    tuple(self.env["mail.message"].get_failed_states()),
+                ),
+            )
+
+    @api.model
+    def _cron_archive(self, limit=ARCHIVE_BATCH_SIZE):
+        """Move the trackings older than the retention policy to the archive"""
+        tracking_model = self.env["mail.tracking.email"]
+        tracking_model.flush_model()
+        self.env["mail.tracking.event"].flush_model()
+        self.env["mail.message"].flush_model(["mail_tracking_failed"])
+        testing = getattr(threading.current_thread(), "testing", False)
+        now = fields.Datetime.now()
+        archived = 0
+        for state, months in self._retention_months().items():
+            if not months:
+                continue
+            limit_date = now - relativedelta(months=months)
+            # Plain conditions on the indexed columns
+            state_clause = "state = %(state)s" if state else "state IS NULL"
+            last_id = 0
+            while True:
+                self.env.cr.execute(
+                    f"""
+                    SELECT id FROM mail_tracking_email
+                    WHERE id > %(last_id)s
+                        AND {state_clause}
+                        AND time < %(limit_date)s
+                    ORDER BY id
+                    LIMIT %(limit)s
+                    """,
+                    {
+                        "last_id": last_id,
+                        "state": state,
+                        "limit_date": limit_date,
+                        "limit": limit,
+                    },
+                )
+                tracking_ids = [row[0] for row in self.env.cr.fetchall()]
+                if not tracking_ids:
+                    break
+                last_id = tracking_ids[-1]
+                self._archive_ids(tracking_ids)
+                archived += len(tracking_ids)
+                if not testing:
+                    self.env.cr.commit()  # pylint: disable=invalid-commit
+        if archived:
+            _logger.info("%d mail trackings moved to the archive", archived)
+            tracking_model.invalidate_model()
+            self.env["mail.tracking.event"].invalidate_model()
+            self.env["mail.message"].invalidate_model(
+                ["mail_tracking_ids", "mail_tracking_failed"]
+            )
+            self.invalidate_model()
+        return archived
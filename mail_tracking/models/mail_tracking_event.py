@@ -1,12 +1,13 @@
 # Copyright 2016 Antonio Espinosa - <antonio.espinosa@tecnativa.com>
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
 
-import re
 import time
 from datetime import datetime
 
 from odoo import api, fields, models
 
+from ..tools import email_address_normalize
+
 
 class MailTrackingEvent(models.Model):
     _name = "mail.tracking.event"
@@ -68,14 +69,7 @@ class MailTrackingEvent(models.Model):
     @api.depends("recipient")
     def _compute_recipient_address(self):
         for email in self:
-            if email.recipient:
-                matches = re.search(r"<(.*@.*)>", email.recipient)
-                if matches:
-                    email.recipient_address = matches.group(1).lower()
-                else:
-                    email.recipient_address = email.recipient.lower()
-            else:
-                email.recipient_address = False
+            email.recipient_address = email_address_normalize(email.recipient)
 
     @api.depends("time")
     def _compute_date(self):
@@ -105,17 +99,28 @@ class MailTrackingEvent(models.Model):
             "error_details": metadata.get("error_details", False),
         }
 
+    def _tracking_email_write(self, tracking_email, vals):
+        """Write on the tracking email, or delay the write until the end of
+        the batch when processing several events at once.
+        """
+        batch = self.env.context.get("mail_tracking_event_batch")
+        if batch is None:
+            tracking_email.sudo().write(vals)
+        else:
+            batch["trackings"].setdefault(tracking_email.id, {}).update(vals)
+
     def _process_status(self, tracking_email, metadata, event_type, state):
-        tracking_email.sudo().write({"state": state})
+        self._tracking_email_write(tracking_email, {"state": state})
         return self._process_data(tracking_email, metadata, event_type, state)
 
     def _process_bounce(self, tracking_email, metadata, event_type, state):
-        tracking_email.sudo().write(
+        self._tracking_email_write(
+            tracking_email,
             {
                 "state": state,
                 "bounce_type": metadata.get("bounce_type", False),
                 "bounce_description": metadata.get("bounce_description", False),
-            }
+            },
         )
         return self._process_data(tracking_email, metadata, event_type, state)
 
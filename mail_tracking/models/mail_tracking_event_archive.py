@@ -0,0 +1,52 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+from odoo import api, fields, models
+
+
+class MailTrackingEventArchive(models.Model):
+    """Compact copy of the events of the archived trackings"""
+
+    _name = "mail.tracking.event.archive"
+    _description = "MailTracking event archive"
+    _order = "timestamp desc"
+    _rec_name = "event_type"
+    _log_access = False
+
+    tracking_email_id = fields.Many2one(
+        string="Message",
+        readonly=True,
+        required=True,
+        ondelete="cascade",
+        comodel_name="mail.tracking.email.archive",
+        index=True,
+    )
+    recipient = fields.Char(readonly=True)
+    timestamp = fields.Float(
+        string="UTC timestamp", readonly=True, digits="MailTracking Timestamp"
+    )
+    time = fields.Datetime(readonly=True)
+    event_type = fields.Selection(selection="_selection_event_type", readonly=True)
+    url = fields.Char(string="Clicked URL", readonly=True)
+    ip = fields.Char(string="User IP", readonly=True)
+    error_type = fields.Char(readonly=True)
+    error_description = fields.Char(readonly=True)
+
+    @api.model
+    def _selection_event_type(self):
+        return self.env["mail.tracking.event"]._fields["event_type"].selection
+
+    @api.model
+    def _archive_columns(self):
+        """Columns copied from mail_tracking_event"""
+        return [
+            "id",
+            "tracking_email_id",
+            "recipient",
+            "timestamp",
+            "time",
+            "event_type",
+            "url",
+            "ip",
+            "error_type",
+            "error_description",
+        ]
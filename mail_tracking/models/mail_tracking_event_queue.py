@@ -0,0 +1,246 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from odoo import api, fields, models
+
+_logger = logging.getLogger(__name__)
+
+# Default number of queued events processed per transaction
+QUEUE_BATCH_SIZE = 1000
+# Failed events are retried after QUEUE_RETRY_DELAY * 2 ** attempts seconds,
+# until they are quarantined after QUEUE_MAX_ATTEMPTS attempts
+QUEUE_RETRY_DELAY = 60
+QUEUE_MAX_ATTEMPTS = 5
+
+
+class MailTrackingEventQueue(models.Model):
+    """Append only staging area for tracking events received over HTTP.
+
+    Controllers only store the raw payloads with one plain SQL insert, and a
+    cron folds them into mail.tracking.event, so the requests don't wait for
+    the tracking state machine. Each source must implement a
+    ``_process_<source>`` method receiving the queued records.
+    """
+
+    _name = "mail.tracking.event.queue"
+    _description = "MailTracking event queue"
+    _order = "id"
+    _log_access = False
+
+    source = fields.Selection(
+        selection=[("open", "Tracking image")],
+        required=True,
+        readonly=True,
+        default="open",
+        ondelete={"open": "cascade"},
+    )
+    state = fields.Selection(
+        selection=[("pending", "Pending"), ("quarantine", "Quarantine")],
+        required=True,
+        readonly=True,
+        default="pending",
+        index=True,
+    )
+    tracking_email_id = fields.Many2one(
+        string="Email",
+        comodel_name="mail.tracking.email",
+        readonly=True,
+        index=True,
+        ondelete="cascade",
+    )
+    event_type = fields.Char(readonly=True)
+    timestamp = fields.Float(
+        string="Received", readonly=True, digits="MailTracking Timestamp"
+    )
+    payload = fields.Text(readonly=True, help="Event data, JSON encoded")
+    attempts = fields.Integer(readonly=True)
+    next_attempt = fields.Datetime(readonly=True)
+    error = fields.Text(readonly=True)
+    age = fields.Float(
+        string="Age (minutes)",
+        compute="_compute_age",
+        help="Time elapsed since the event was received",
+    )
+
+    def _compute_age(self):
+        now = time.time()
+        for item in self:
+            item.age = (now - item.timestamp) / 60 if item.timestamp else 0.0
+
+    @api.model
+    def _enqueue(self, source, payloads):
+        """Store raw payloads in the queue with a single query
+
+        :param payloads: list of JSON serializable objects
+        """
+        if not payloads:
+            return
+        self.env.cr.execute(
+            """
+            INSERT INTO mail_tracking_event_queue
+                (source, state, timestamp, payload, attempts)
+            SELECT %s, 'pending', %s, payload, 0
+            FROM unnest(%s::text[]) AS payload
+            """,
+            (
+                source,
+                time.time(),
+                [json.dumps(payload, default=str) for payload in payloads],
+            ),
+        )
+
+    @api.model
+    def _stage_open(self, tracking_email_id, token, metadata):
+        """Validate the tracking token and stage an open event in a single
+        indexed query, without going through the ORM.
+
+        :return: True if the open event has been staged
+        """
+        self.env.cr.execute(
+            """
+            INSERT INTO mail_tracking_event_queue
+                (source, state, tracking_email_id, event_type, timestamp,
+                 payload, attempts)
+            SELECT 'open', 'pending', id, 'open', %(timestamp)s, %(payload)s, 0
+            FROM mail_tracking_email
+            WHERE id = %(id)s
+                AND token IS NOT DISTINCT FROM %(token)s
+                AND state IN ('sent', 'delivered')
+            """,
+            {
+                "id": tracking_email_id,
+                "token": token or None,
+                "timestamp": metadata["timestamp"],
+                "payload": json.dumps(metadata, default=str),
+            },
+        )
+        return bool(self.env.cr.rowcount)
+
+    def _events_prepare(self):
+        """Convert the staged rows to ``event_create_batch`` arguments.
+
+        As the pixel route only creates an open event for trackings in sent or
+        delivered state, only the earliest staged open of each of them is
+        kept.
+        """
+        trackings = self.mapped("tracking_email_id").filtered(
+            lambda x: x.state in ("sent", "delivered")
+        )
+        opened = set()
+        events = []
+        for item in self.sorted("timestamp"):
+            tracking = item.tracking_email_id
+            if item.event_type == "open":
+                if tracking not in trackings or tracking.id in opened:
+                    continue
+                opened.add(tracking.id)
+            events.append(
+                (tracking.id, item.event_type, json.loads(item.payload or "{}"))
+            )
+        return events
+
+    def _process_open(self):
+        self.env["mail.tracking.email"].sudo().event_create_batch(
+            self._events_prepare()
+        )
+
+    def _process(self):
+        """Process the queued events, grouped by source"""
+        by_source = defaultdict(lambda: self.browse())
+        for item in self:
+            by_source[item.source] |= item
+        for source, items in by_source.items():
+            getattr(items, "_process_" + source)()
+
+    def _process_failed(self, error):
+        """Schedule a retry with exponential backoff, or quarantine the event
+        when it has failed too many times.
+        """
+        for item in self:
+            attempts = item.attempts + 1
+            vals = {"attempts": attempts, "error": error}
+            if attempts >= QUEUE_MAX_ATTEMPTS:
+                _logger.warning("Queued tracking event %d quarantined", item.id)
+                vals["state"] = "quarantine"
+            else:
+                vals["next_attempt"] = fields.Datetime.now() + timedelta(
+                    seconds=QUEUE_RETRY_DELAY * 2**attempts
+                )
+            item.write(vals)
+
+    def _process_batch(self):
+        """Process a batch of events, and isolate the failing ones on error"""
+        if len(self) > 1:
+            try:
+                with self.env.cr.savepoint():
+                    self._process()
+                    self.unlink()
+                return
+            except Exception:
+                _logger.warning(
+                    "Batch of %d queued tracking events failed, retrying one by one",
+                    len(self),
+                    exc_info=True,
+                )
+                self.env.invalidate_all()
+        for item in self:
+            try:
+                with self.env.cr.savepoint():
+                    item._process()
+                    item.unlink()
+            except Exception as error:
+                _logger.warning("Queued tracking event %d failed: %s", item.id, error)
+                self.env.invalidate_all()
+                item._process_failed(str(error))
+
+    @api.model
+    def _batch_fetch(self, limit):
+        """Lock the next pending events, skipping the ones locked by other
+        workers draining the queue at the same time.
+        """
+        self.flush_model()
+        self.env.cr.execute(
+            """
+            SELECT id FROM mail_tracking_event_queue
+            WHERE state = 'pending'
+                AND (next_attempt IS NULL OR next_attempt <= NOW() AT TIME ZONE 'UTC')
+            ORDER BY id
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+            """,
+            (limit,),
+        )
+        return self.browse([row[0] for row in self.env.cr.fetchall()])
+
+    @api.model
+    def _cron_process(self, limit=None):
+        """Drain the queue, committing after each batch"""
+        if limit is None:
+            limit = int(
+                self.env["ir.config_parameter"]
+                .sudo()
+                .get_param("mail_tracking.event_queue_batch_size", QUEUE_BATCH_SIZE)
+            )
+        testing = getattr(threading.current_thread(), "testing", False)
+        while True:
+            items = self._batch_fetch(limit)
+            if not items:
+                break
+            _logger.debug("Processing %d queued tracking events", len(items))
+            items._process_batch()
+            if not testing:
+                self.env.cr.commit()  # pylint: disable=invalid-commit
+            if len(items) < limit:
+                break
+
+    def action_requeue(self):
+        """Give another chance to quarantined events"""
+        self.write(
+            {"state": "pending", "attempts": 0, "next_attempt": False, "error": False}
+        )
@@ -0,0 +1,56 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+from odoo import api, fields, models, tools
+
+
+class MailTrackingEventQueueReport(models.Model):
+    """Depth and lag of the tracking event queue, by source and state.
+
+    The values are computed by a SQL view when read, so they can be sorted,
+    grouped and used as measures to monitor the queue.
+    """
+
+    _name = "mail.tracking.event.queue.report"
+    _description = "MailTracking event queue analysis"
+    _order = "lag desc"
+    _rec_name = "source"
+    _auto = False
+
+    source = fields.Selection(selection="_selection_source", readonly=True)
+    state = fields.Selection(
+        selection=[("pending", "Pending"), ("quarantine", "Quarantine")],
+        readonly=True,
+    )
+    count = fields.Integer(string="Events", readonly=True, group_operator="sum")
+    oldest_date = fields.Datetime(
+        string="Oldest received", readonly=True, help="Reception of the oldest event"
+    )
+    lag = fields.Float(
+        string="Lag (minutes)",
+        readonly=True,
+        group_operator="max",
+        help="Time elapsed since the oldest event was received",
+    )
+
+    @api.model
+    def _selection_source(self):
+        field = self.env["mail.tracking.event.queue"]._fields["source"]
+        return field._description_selection(self.env)
+
+    def init(self):
+        tools.drop_view_if_exists(self.env.cr, self._table)
+        self.env.cr.execute(
+            """
+            CREATE OR REPLACE VIEW mail_tracking_event_queue_report AS (
+                SELECT
+                    MIN(id) AS id,
+                    source,
+                    state,
+                    COUNT(*) AS count,
+                    to_timestamp(MIN(timestamp)) AT TIME ZONE 'UTC' AS oldest_date,
+                    (EXTRACT(EPOCH FROM NOW()) - MIN(timestamp))::float / 60 AS lag
+                FROM mail_tracking_event_queue
+                GROUP BY source, state
+            )
+            """
+        )
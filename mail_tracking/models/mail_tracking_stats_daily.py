@@ -0,0 +1,168 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+import json
+import logging
+import threading
+
+from odoo import api, fields, models, tools
+
+_logger = logging.getLogger(__name__)
+
+# Events folded into the rollup per transaction
+STATS_DAILY_BATCH_SIZE = 100000
+STATS_DAILY_CHECKPOINT = "mail_tracking.stats_daily_last_event_id"
+# Highest event id sampled at each run with the transactions in progress, to
+# know below which id events can't be added anymore
+STATS_DAILY_SAMPLES = "mail_tracking.stats_daily_event_id_samples"
+STATS_DAILY_MAX_SAMPLES = 100
+
+
+class MailTrackingStatsDaily(models.Model):
+    """Daily rollup of the tracking events for dashboards.
+
+    The counters are incrementally updated by a cron from the events created
+    since its last run, grouped by day and by the dimensions returned by
+    ``_stats_dimensions``, which other modules can extend.
+    """
+
+    _name = "mail.tracking.stats.daily"
+    _description = "MailTracking daily statistics"
+    _order = "date desc, event_type"
+    _rec_name = "date"
+    _log_access = False
+
+    key = fields.Char(readonly=True, required=True)
+    date = fields.Date(readonly=True, index=True)
+    event_type = fields.Selection(selection="_selection_event_type", readonly=True)
+    ua_family = fields.Char(string="User agent family", readonly=True)
+    os_family = fields.Char(string="Operating system family", readonly=True)
+    user_country_id = fields.Many2one(
+        string="User country", comodel_name="res.country", readonly=True
+    )
+    count = fields.Integer(string="Events", readonly=True, group_operator="sum")
+
+    @api.model
+    def _selection_event_type(self):
+        field = self.env["mail.tracking.event"]._fields["event_type"]
+        return field._description_selection(self.env)
+
+    def init(self):
+        tools.create_unique_index(
+            self._cr, "mail_tracking_stats_daily_key_uniq", self._table, ["key"]
+        )
+
+    @api.model
+    def _stats_dimensions(self):
+        """Columns of the rollup and the SQL expression computing them, from
+        the ``event`` and ``tracking`` tables aliases.
+        """
+        return {
+            "date": "event.date",
+            "event_type": "event.event_type",
+            "ua_family": "event.ua_family",
+            "os_family": "event.os_family",
+            "user_country_id": "event.user_country_id",
+        }
+
+    @api.model
+    def _stats_aggregate(self, first_id, last_id):
+        """Add the events with an id in ]first_id, last_id] to the counters"""
+        dimensions = self._stats_dimensions()
+        # Hash of the JSON array of the values, which can't be ambiguous
+        key = "md5(json_build_array(%s)::text)" % ", ".join(dimensions.values())
+        columns = ", ".join(dimensions)
+        self.env.cr.execute(
+            """
+            INSERT INTO mail_tracking_stats_daily (key, count, {columns})
+            SELECT key, COUNT(*), {columns}
+            FROM (
+                SELECT {key} AS key, {expressions}
+                FROM mail_tracking_event event
+                LEFT JOIN mail_tracking_email tracking
+                    ON tracking.id = event.tracking_email_id
+                WHERE event.id > %s AND event.id <= %s
+            ) AS events
+            GROUP BY key, {columns}
+            ON CONFLICT (key)
+            DO UPDATE SET count = mail_tracking_stats_daily.count + EXCLUDED.count
+            """.format(
+                columns=columns,
+                key=key,
+                expressions=", ".join(
+                    "%s AS %s" % (expression, column)
+                    for column, expression in dimensions.items()
+                ),
+            ),
+            (first_id, last_id),
+        )
+
+    @api.model
+    def _stats_transactions_in_progress(self):
+        """Ids of the transactions in progress in the snapshot of the current
+        one
+        """
+        self.env.cr.execute("SELECT txid_snapshot_xip(txid_current_snapshot())")
+        return {row[0] for row in self.env.cr.fetchall()}
+
+    @api.model
+    def _stats_last_event_id(self):
+        """Last event id below which no event can be added anymore.
+
+        The create_date of the events is the start of their transaction, so
+        it can't tell whether a transaction still in progress may add events
+        below an id. Instead, the highest visible id is sampled at each run
+        with the transactions in progress, which are the only ones that can
+        still add events below it. Once none of them is in progress anymore,
+        the ids up to that sample are final.
+        """
+        checkpoint_obj = self.env["mail.tracking.checkpoint"].sudo()
+        samples = json.loads(checkpoint_obj._checkpoint_get(STATS_DAILY_SAMPLES, "[]"))
+        self.env.cr.execute("SELECT COALESCE(MAX(id), 0) FROM mail_tracking_event")
+        max_id = self.env.cr.fetchone()[0]
+        in_progress = self._stats_transactions_in_progress()
+        samples.append([max_id, sorted(in_progress)])
+        last_id, final = 0, 0
+        for index, (sample_id, sample_in_progress) in enumerate(samples, 1):
+            # The transactions of a sample can't be in progress if the ones of
+            # a later sample are not, as they started earlier
+            if in_progress.isdisjoint(sample_in_progress):
+                last_id, final = sample_id, index
+        samples = samples[final:]
+        if len(samples) > STATS_DAILY_MAX_SAMPLES:
+            # Dropping intermediate samples only delays the counting
+            samples = samples[: STATS_DAILY_MAX_SAMPLES - 1] + samples[-1:]
+        checkpoint_obj._checkpoint_set(STATS_DAILY_SAMPLES, json.dumps(samples))
+        return last_id
+
+    @api.model
+    def _cron_update(self, limit=STATS_DAILY_BATCH_SIZE):
+        """Fold the events added since the last run into the counters,
+        committing after each batch.
+        """
+        self.env["mail.tracking.event"].flush_model()
+        self.env["mail.tracking.email"].flush_model()
+        checkpoint_obj = self.env["mail.tracking.checkpoint"].sudo()
+        testing = getattr(threading.current_thread(), "testing", False)
+        first_id = int(checkpoint_obj._checkpoint_get(STATS_DAILY_CHECKPOINT, 0))
+        last_id = self._stats_last_event_id()
+        while first_id < last_id:
+            batch_last_id = min(first_id + limit, last_id)
+            self._stats_aggregate(first_id, batch_last_id)
+            checkpoint_obj._checkpoint_set(STATS_DAILY_CHECKPOINT, batch_last_id)
+            first_id = batch_last_id
+            if not testing:
+                self.env.cr.commit()  # pylint: disable=invalid-commit
+        self.invalidate_model()
+        return True
+
+    @api.model
+    def _rebuild(self):
+        """Recompute all the counters from the events table, e.g. after adding
+        a dimension.
+        """
+        _logger.info("Rebuilding mail tracking daily statistics")
+        self.env.cr.execute("DELETE FROM mail_tracking_stats_daily")
+        self.env["mail.tracking.checkpoint"].sudo()._checkpoint_set(
+            STATS_DAILY_CHECKPOINT, 0
+        )
+        return self._cron_update()
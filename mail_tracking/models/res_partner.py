@@ -15,18 +15,24 @@ class ResPartner(models.Model):
     )
     email_score = fields.Float(compute="_compute_email_score_and_count", readonly=True)
 
-    @api.depends("email")
+    @api.depends("email", "email_normalized")
     def _compute_email_score_and_count(self):
         self.email_score = 50.0
         self.tracking_emails_count = 0
         partners_mail = self.filtered("email")
+        if not partners_mail:
+            return
         mt_obj = self.env["mail.tracking.email"].sudo()
+        stats = (
+            self.env["mail.tracking.address.stats"]
+            .sudo()
+            ._stats_get(partners_mail.mapped("email_normalized"))
+        )
+        # We don't want performance issues due to heavy ACLs check for large
+        # recordsets. Our option is to hide the number for regular users.
+        show_count = self.env.user.has_group("base.group_system")
         for partner in partners_mail:
-            partner.email_score = mt_obj.email_score_from_email(partner.email)
-            # We don't want performance issues due to heavy ACLs check for large
-            # recordsets. Our option is to hide the number for regular users.
-            if not self.env.user.has_group("base.group_system"):
-                continue
-            partner.tracking_emails_count = len(
-                mt_obj._search([("recipient_address", "=", partner.email.lower())])
-            )
+            states = stats.get(partner.email_normalized, {})
+            partner.email_score = mt_obj._email_score_from_states(states)
+            if show_count:
+                partner.tracking_emails_count = sum(states.values())
@@ -2,18 +2,24 @@
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
 
 import base64
+import csv
+import io
 import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
 from unittest.mock import patch
 
 from werkzeug.exceptions import BadRequest
 
-from odoo import http
+from odoo import fields, http
+from odoo.exceptions import AccessError, UserError
 from odoo.fields import Command
 from odoo.tests.common import TransactionCase
 from odoo.tools import mute_logger
 
 from ..controllers.discuss import MailTrackingDiscussController
 from ..controllers.main import BLANK, MailTrackingController
+from ..tools import TRACKING_IMG_RE, TTLCache
 
 mock_send_email = "odoo.addons.base.models.ir_mail_server." "IrMailServer.send_email"
 
@@ -78,6 +84,23 @@ class TestMailTracking(TransactionCase):
         mail, tracking = self.mail_send(self.recipient.email)
         tracking.write({"recipient": False})
         self.assertEqual(False, tracking.recipient_address)
+        tracking.write({"recipient": '"Some One" <Some.One@Example.COM>'})
+        self.assertEqual(tracking.recipient_address, "some.one@example.com")
+        event = tracking.event_create(
+            "hard_bounce", {"recipient": "SOME.ONE@example.com, other@example.com"}
+        )
+        self.assertEqual(event.recipient_address, "some.one@example.com")
+
+    def test_recipient_address_bounce_partner(self):
+        partner = self.env["res.partner"].create(
+            {"name": "Some One", "email": '"Some One" <some.one@example.com>'}
+        )
+        mail, tracking = self.mail_send("Some.One@Example.com")
+        tracking.event_create("hard_bounce", {})
+        self.assertTrue(partner.email_bounced)
+        self.assertTrue(
+            self.env["mail.tracking.email"].email_is_bounced("SOME.ONE@example.com")
+        )
 
     def test_message_post(self):
         # This message will generate a notification for recipient
@@ -129,6 +152,84 @@ class TestMailTracking(TransactionCase):
         tracking_email.event_create("open", metadata)
         self.assertEqual(tracking_email.state, "opened")
 
+    def _create_notified_message(self):
+        message = self.env["mail.message"].create(
+            {
+                "subject": "Message test",
+                "author_id": self.sender.id,
+                "email_from": self.sender.email,
+                "message_type": "comment",
+                "model": "res.partner",
+                "res_id": self.recipient.id,
+                "partner_ids": [Command.link(self.recipient.id)],
+                "email_cc": "Dominique Pinon <unnamed@test.com>, sender@example.com",
+                "body": "<p>This is a test message</p>",
+            }
+        )
+        self.env[message.model].browse(message.res_id)._notify_thread(message)
+        return message
+
+    def _tracking_status_query_count(self, messages):
+        self.env.flush_all()
+        self.env.invalidate_all()
+        queries_before = self.env.cr.sql_log_count
+        messages.tracking_status()
+        return self.env.cr.sql_log_count - queries_before
+
+    def test_tracking_status_query_count(self):
+        messages = self.env["mail.message"]
+        for _i in range(6):
+            messages |= self._create_notified_message()
+        # Warm up ormcaches (aliases, groups...)
+        messages.tracking_status()
+        single_count = self._tracking_status_query_count(messages[:1])
+        page_count = self._tracking_status_query_count(messages)
+        self.assertEqual(single_count, page_count)
+        # Batched output is the same as the message by message one
+        statuses = messages.tracking_status()
+        for message in messages:
+            self.assertEqual(
+                statuses[message.id], message.tracking_status()[message.id]
+            )
+
+    def test_search_acl_large(self):
+        user = self.env["res.users"].create(
+            {
+                "name": "Tracking User Test",
+                "login": "tracking-user-test",
+                "groups_id": [Command.set([self.env.ref("base.group_user").id])],
+            }
+        )
+        message_obj = self.env["mail.message"]
+        # Messages not linked to any document: only the author can read them
+        allowed_message = message_obj.create(
+            {"body": "Allowed", "author_id": user.partner_id.id}
+        )
+        forbidden_message = message_obj.create({"body": "Forbidden"})
+        self.env.flush_all()
+        self.env.cr.execute(
+            """
+            INSERT INTO mail_tracking_email (name, state, recipient, mail_message_id)
+            SELECT 'ACL test ' || i, 'sent', 'acl-test@example.com',
+                CASE WHEN i %% 2 = 0 THEN %s ELSE %s END
+            FROM generate_series(1, 100000) AS i
+            """,
+            (allowed_message.id, forbidden_message.id),
+        )
+        tracking_obj = self.env["mail.tracking.email"].with_user(user)
+        domain = [("recipient", "=", "acl-test@example.com")]
+        # Pages are complete and counts are right
+        trackings = tracking_obj.search(domain, limit=80, offset=80)
+        self.assertEqual(len(trackings), 80)
+        self.assertEqual(trackings.mail_message_id, allowed_message)
+        self.assertEqual(tracking_obj.search_count(domain), 50000)
+        trackings.read(["name"])
+        forbidden = self.env["mail.tracking.email"].search(
+            domain + [("mail_message_id", "=", forbidden_message.id)], limit=1
+        )
+        with self.assertRaises(AccessError):
+            forbidden.with_user(user).read(["name"])
+
     def test_message_post_partner_no_email(self):
         # Create message with recipient without defined email
         self.recipient.write({"email": False})
@@ -295,6 +396,7 @@ class TestMailTracking(TransactionCase):
         # Force error state
         tracking.state = "error"
         self.assertTrue(tracking.mail_message_id.mail_tracking_needs_action)
+        self.assertTrue(tracking.mail_message_id.mail_tracking_failed)
         failed_count = MailMessageObj.get_failed_count()
         self.assertTrue(failed_count > 0)
         values = tracking.mail_message_id.get_failed_messages()
@@ -306,6 +408,7 @@ class TestMailTracking(TransactionCase):
         self.assertTrue(len(messages) > len(messages_failed))
         tracking.mail_message_id.set_need_action_done()
         self.assertFalse(tracking.mail_message_id.mail_tracking_needs_action)
+        self.assertFalse(tracking.mail_message_id.mail_tracking_failed)
         self.assertTrue(MailMessageObj.get_failed_count() < failed_count)
         # No author_id
         tracking.mail_message_id.author_id = False
@@ -353,6 +456,20 @@ class TestMailTracking(TransactionCase):
         # Check tracking reset
         self.assertFalse(tracking_email.state)
 
+    @contextmanager
+    def _queries_log(self):
+        """Record the SQL queries executed within the context"""
+        queries = []
+        cursor_class = type(self.env.cr)
+        execute = cursor_class.execute
+
+        def execute_log(cr, query, params=None, log_exceptions=True):
+            queries.append(str(query))
+            return execute(cr, query, params, log_exceptions)
+
+        with patch.object(cursor_class, "execute", execute_log):
+            yield queries
+
     def mail_send(self, recipient):
         mail = self.env["mail.mail"].create(
             {
@@ -389,6 +506,99 @@ class TestMailTracking(TransactionCase):
             # Two events again because no tracking_email_id found for False
             self.assertEqual(2, len(tracking.tracking_event_ids))
 
+    def test_mail_send_preallocated_trackings(self):
+        partners = self.env["res.partner"].create(
+            [
+                {
+                    "name": "Test recipient %d" % i,
+                    "email": "recipient%d@example.com" % i,
+                }
+                for i in range(3)
+            ]
+        )
+        mails = self.env["mail.mail"].create(
+            [
+                {
+                    "subject": "Test subject %d" % i,
+                    "email_from": "from@domain.com",
+                    "email_to": "to%d@example.com" % i,
+                    "recipient_ids": [Command.set(partners.ids)],
+                    "body_html": "<p>This is a test message</p>",
+                }
+                for i in range(3)
+            ]
+        )
+        with self._queries_log() as queries:
+            mails.send()
+        # All the trackings are created by a single query for the whole batch,
+        # already with their recipients
+        self.assertEqual(
+            len([x for x in queries if 'INSERT INTO "mail_tracking_email"' in x]), 1
+        )
+        self.assertFalse(
+            [
+                x
+                for x in queries
+                if x.lstrip().startswith('UPDATE "mail_tracking_email"')
+                and '"recipient"' in x
+            ]
+        )
+        trackings = self.env["mail.tracking.email"].search(
+            [("mail_id", "in", mails.ids)]
+        )
+        self.assertEqual(len(trackings), 12)
+        self.assertEqual(set(trackings.mapped("state")), {"sent"})
+        self.assertEqual(
+            set(trackings.filtered(lambda x: not x.partner_id).mapped("recipient")),
+            {"to0@example.com", "to1@example.com", "to2@example.com"},
+        )
+
+    def test_gc_preallocated_trackings(self):
+        mail = self.env["mail.mail"].create(
+            {
+                "subject": "Test subject",
+                "email_from": "from@domain.com",
+                "email_to": "to@example.com",
+                "body_html": "<p>This is a test message</p>",
+            }
+        )
+        # Sending interrupted after the trackings creation
+        preallocated = mail._tracking_emails_preallocate()
+        tracking = self.env["mail.tracking.email"].browse(preallocated.values())
+        self.assertEqual(tracking.recipient, "to@example.com")
+        self.env["mail.tracking.email"]._gc_preallocated_trackings()
+        self.assertTrue(tracking.exists())
+        with patch.object(
+            fields.Datetime, "now", return_value=datetime.now() + timedelta(days=2)
+        ):
+            self.env["mail.tracking.email"]._gc_preallocated_trackings()
+        self.assertFalse(tracking.exists())
+
+    @mute_logger("odoo.addons.mail.models.mail_mail")
+    def test_mail_send_preallocated_trackings_exception(self):
+        mails = self.env["mail.mail"].create(
+            [
+                {
+                    "subject": "Test subject %d" % i,
+                    "email_from": "from@domain.com",
+                    "email_to": "to%d@example.com" % i,
+                    "body_html": "<p>This is a test message</p>",
+                }
+                for i in range(3)
+            ]
+        )
+        with patch.object(
+            type(self.env["ir.mail_server"]),
+            "build_email",
+            side_effect=UserError("Build failure"),
+        ), self.assertRaises(UserError):
+            mails._send(raise_exception=True)
+        # The trackings of the emails that were not even tried are removed
+        trackings = self.env["mail.tracking.email"].search(
+            [("mail_id", "in", mails.ids)]
+        )
+        self.assertEqual(len(trackings), 1)
+
     @mute_logger("odoo.addons.mail_tracking.controllers.main")
     def test_mail_tracking_open(self):
         def mock_error_function(*args, **kwargs):
@@ -438,6 +648,94 @@ class TestMailTracking(TransactionCase):
             mock_client.return_value = False
             controller.mail_tracking_open(db, tracking.id, False)
 
+    def test_mail_tracking_open_fast_path(self):
+        self.env["ir.config_parameter"].set_param(
+            "mail_tracking.open_fast_path", "True"
+        )
+        queue_obj = self.env["mail.tracking.event.queue"]
+        controller = MailTrackingController()
+        db = self.env.cr.dbname
+        image = base64.b64decode(BLANK)
+        with patch("odoo.http.db_filter") as mock_client:
+            mock_client.return_value = True
+            mail, tracking = self.mail_send(self.recipient.email)
+            # Wrong token: nothing staged
+            res = controller.mail_tracking_open(db, tracking.id, "tokentest")
+            self.assertEqual(image, res.response[0])
+            self.assertFalse(queue_obj.search([]))
+            # Two hits are staged, but no event is created yet
+            controller.mail_tracking_open(db, tracking.id, tracking.token)
+            controller.mail_tracking_open(db, tracking.id, tracking.token)
+            self.assertEqual(2, queue_obj.search_count([]))
+            self.assertEqual(1, len(tracking.tracking_event_ids))
+        queue_obj._cron_process()
+        self.assertFalse(queue_obj.search([]))
+        self.assertEqual(tracking.state, "opened")
+        opens = tracking.tracking_event_ids.filtered(lambda r: r.event_type == "open")
+        self.assertEqual(len(opens), 1)
+        self.assertEqual(opens.ip, "123.123.123.123")
+
+    @mute_logger("odoo.addons.mail_tracking.models.mail_tracking_event_queue")
+    def test_event_queue_retry(self):
+        queue_obj = self.env["mail.tracking.event.queue"]
+        mail, tracking = self.mail_send(self.recipient.email)
+        mail2, tracking2 = self.mail_send(self.recipient.email)
+        for tracking_id in (tracking.id, tracking2.id):
+            queue_obj._stage_open(tracking_id, False, {"timestamp": time.time()})
+        process_open = type(queue_obj)._process_open
+
+        def _process_open_poisoned(items):
+            if tracking2 in items.tracking_email_id:
+                raise ValueError("Poisoned event")
+            return process_open(items)
+
+        with patch.object(
+            type(queue_obj), "_process_open", autospec=True
+        ) as mock_process:
+            mock_process.side_effect = _process_open_poisoned
+            queue_obj._cron_process()
+        # The healthy event is processed, the poisoned one is delayed
+        self.assertEqual(tracking.state, "opened")
+        item = queue_obj.search([])
+        self.assertEqual(item.tracking_email_id, tracking2)
+        self.assertEqual((item.state, item.attempts), ("pending", 1))
+        self.assertIn("Poisoned event", item.error)
+        self.assertTrue(item.next_attempt)
+        item.write({"attempts": 10})
+        item._process_failed("Poisoned event")
+        self.assertEqual(item.state, "quarantine")
+        item.action_requeue()
+        queue_obj._cron_process()
+        self.assertFalse(queue_obj.search([]))
+        self.assertEqual(tracking2.state, "opened")
+
+    def test_event_queue_report(self):
+        queue_obj = self.env["mail.tracking.event.queue"]
+        report_obj = self.env["mail.tracking.event.queue.report"]
+        now = time.time()
+        queue_obj._enqueue("open", [{"n": 1}, {"n": 2}, {"n": 3}])
+        queue_obj.flush_model()
+        self.env.cr.execute(
+            "UPDATE mail_tracking_event_queue SET timestamp = %s WHERE id = %s",
+            (now - 600, min(queue_obj.search([]).ids)),
+        )
+        queue_obj.search([], limit=1).write({"state": "quarantine"})
+        queue_obj.flush_model()
+        pending = report_obj.search([("state", "=", "pending")])
+        self.assertEqual(pending.count, 2)
+        self.assertLess(pending.lag, 5)
+        quarantine = report_obj.search([("state", "=", "quarantine")])
+        self.assertEqual(quarantine.count, 1)
+        self.assertGreater(quarantine.lag, 9)
+        self.assertEqual(
+            quarantine.oldest_date, datetime.utcfromtimestamp(int(now - 600))
+        )
+        # Sortable and usable as measures
+        self.assertEqual(report_obj.search([], order="lag desc")[0], quarantine)
+        groups = report_obj.read_group([], ["count", "lag"], ["source"])
+        self.assertEqual(groups[0]["count"], 3)
+        self.assertGreater(groups[0]["lag"], 9)
+
     def test_db_env_no_cr(self):
         http.request.env = None
         db = self.env.cr.dbname
@@ -508,6 +806,78 @@ class TestMailTracking(TransactionCase):
         opens = tracking.tracking_event_ids.filtered(lambda r: r.event_type == "click")
         self.assertEqual(len(opens), 3)
 
+    def test_concurrent_events_cache(self):
+        mail, tracking = self.mail_send(self.recipient.email)
+        tracking_obj = self.env["mail.tracking.email"]
+        cache = tracking_obj._concurrent_events_cache()
+        self.addCleanup(cache.clear)
+        cache.clear()
+        ts = time.time()
+        cache.set((tracking.id, "open", False), (ts,))
+        # Cache hit: discarded without querying the database
+        self.assertFalse(tracking.event_create("open", {"timestamp": ts + 2}))
+        self.assertEqual(tracking_obj.concurrent_events_cache_stats()["hits"], 1)
+        # Cache miss: the database is searched
+        self.assertTrue(tracking.event_create("open", {"timestamp": ts + 350}))
+        stats = tracking_obj.concurrent_events_cache_stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+        self.assertFalse(tracking.event_create("open", {"timestamp": ts + 351}))
+
+    def test_concurrent_events_cache_rollback(self):
+        mail, tracking = self.mail_send(self.recipient.email)
+        tracking_obj = self.env["mail.tracking.email"]
+        cache = tracking_obj._concurrent_events_cache()
+        self.addCleanup(cache.clear)
+        cache.clear()
+        key = (tracking.id, "open", False)
+        ts = time.time()
+        for flush in (True, False):
+            with self.assertRaises(ValueError), self.env.cr.savepoint(flush=flush):
+                self.assertTrue(tracking.event_create("open", {"timestamp": ts}))
+                raise ValueError("Rollback")
+            self.env.invalidate_all(flush=False)
+            self.env.cr.flush()
+            self.env.cr.postcommit.run()
+            # The events rolled back are not remembered
+            self.assertIsNone(cache.get(key))
+        self.assertTrue(tracking.event_create("open", {"timestamp": ts}))
+        self.env.cr.flush()
+        self.env.cr.postcommit.run()
+        self.assertEqual(cache.get(key), (ts,))
+
+    def test_event_create_batch(self):
+        mail, tracking = self.mail_send(self.recipient.email)
+        mail2, tracking2 = self.mail_send(self.recipient.email)
+        ts = time.time()
+        metadata = {"ip": "127.0.0.1", "timestamp": ts}
+        events = [
+            (tracking.id, "delivered", dict(metadata)),
+            (tracking.id, "open", dict(metadata)),
+            # Concurrent with the previous one, in the same batch
+            (tracking.id, "open", dict(metadata, timestamp=ts + 2)),
+            (tracking.id, "click", dict(metadata, url="https://www.example.com/1")),
+            (tracking2.id, "hard_bounce", dict(metadata)),
+        ]
+        with patch.object(
+            type(self.env["mail.tracking.event"]),
+            "create",
+            autospec=True,
+            side_effect=type(self.env["mail.tracking.event"]).create,
+        ) as mock_create:
+            created = self.env["mail.tracking.email"].event_create_batch(events)
+        self.assertEqual(mock_create.call_count, 1)
+        self.assertEqual(len(created), 4)
+        self.assertEqual(
+            sorted(tracking.tracking_event_ids.mapped("event_type")),
+            ["click", "delivered", "open"],
+        )
+        self.assertEqual(tracking.state, "opened")
+        self.assertEqual(tracking2.state, "bounced")
+        self.assertTrue(self.recipient.email_bounced)
+        # Replaying the batch is a no-op for concurrent opens and clicks
+        created = self.env["mail.tracking.email"].event_create_batch(events[1:4])
+        self.assertFalse(created)
+
     @mute_logger("odoo.addons.mail.models.mail_mail")
     def test_smtp_error(self):
         with patch(mock_send_email) as mock_func:
@@ -591,6 +961,31 @@ class TestMailTracking(TransactionCase):
             self.assertEqual("bounced", tracking.state)
         self.assertEqual(0.0, self.recipient.email_score)
 
+    def test_email_bounced_propagate(self):
+        partner_obj = self.env["res.partner"]
+        partners = partner_obj.create(
+            [
+                {"name": "Bounce A", "email": "Bounce-A@example.com"},
+                {"name": "Bounce B", "email": "Bounce B <bounce-b@example.com>"},
+                {"name": "Not bounced", "email": "not-bounced@example.com"},
+            ]
+        )
+        mail, tracking = self.mail_send(self.recipient.email)
+        partner_model = type(partner_obj)
+        with patch.object(
+            partner_model, "search", autospec=True, side_effect=partner_model.search
+        ) as mock_search:
+            bounced = partner_obj._email_bounced_propagate(
+                [
+                    ("bounce-a@example.com", tracking, "hard_bounce", None),
+                    ("BOUNCE-B@example.com", tracking, "hard_bounce", None),
+                    ("unknown@example.com", tracking, "hard_bounce", None),
+                ]
+            )
+        self.assertEqual(mock_search.call_count, 1)
+        self.assertEqual(bounced, partners[:2])
+        self.assertEqual(partners.mapped("email_bounced"), [True, True, False])
+
     def test_bounce_new_partner(self):
         mail, tracking = self.mail_send(self.recipient.email)
         tracking.event_create("hard_bounce", {})
@@ -598,6 +993,207 @@ class TestMailTracking(TransactionCase):
         new_partner.email = self.recipient.email
         self.assertTrue(new_partner.email_bounced)
 
+    def test_bounce_partner_import_batch(self):
+        mail, tracking = self.mail_send(self.recipient.email)
+        tracking.event_create("hard_bounce", {})
+        partners = self.env["res.partner"].create(
+            [{"name": "Import %d" % i} for i in range(50)]
+        )
+        # Creating the partners doesn't look their addresses up
+        self.assertFalse(partners.filtered("email_bounced"))
+        rows = [
+            [str(partner.id), "import-%d@example.com" % i]
+            for i, partner in enumerate(partners[:-1])
+        ]
+        rows.append([str(partners[-1].id), self.recipient.email.upper()])
+        with self._queries_log() as queries:
+            result = self.env["res.partner"].load([".id", "email"], rows)
+        self.assertFalse(result["messages"])
+        # A single lookup for the whole import
+        self.assertEqual(
+            len([x for x in queries if "DISTINCT ON (recipient_address)" in x]), 1
+        )
+        self.assertEqual(partners.filtered("email_bounced"), partners[-1])
+        # Writes outside of an import still look their address up
+        partners[0].email = self.recipient.email
+        self.assertTrue(partners[0].email_bounced)
+
+    def test_address_state_cache(self):
+        tracking_obj = self.env["mail.tracking.email"]
+        self.env["ir.config_parameter"].set_param(
+            "mail_tracking.address_state_cache_ttl", 60
+        )
+        cache = tracking_obj._address_state_cache()
+        cache.clear()
+        self.addCleanup(cache.clear)
+        address = self.recipient.email.lower()
+        mail, tracking = self.mail_send(self.recipient.email)
+        self.assertFalse(tracking_obj.email_is_bounced(address))
+        self.assertEqual(cache.get(address)["state"], "sent")
+        # Cached states are served without querying the database
+        with self.assertQueryCount(0):
+            self.assertFalse(tracking_obj.email_is_bounced(address))
+        # Tracking events invalidate the state of the address
+        tracking.event_create("hard_bounce", {})
+        self.assertIsNone(cache.get(address))
+        self.assertTrue(tracking_obj.email_is_bounced(address))
+
+    def test_address_stats(self):
+        stats_obj = self.env["mail.tracking.address.stats"]
+        address = "stats-test@example.com"
+        self.recipient.email = "Stats-Test@example.com"
+        mail, tracking = self.mail_send(self.recipient.email)
+        self.assertEqual(stats_obj._stats_get([address])[address], {"sent": 1})
+        tracking.event_create("open", {})
+        mail, tracking = self.mail_send(self.recipient.email)
+        tracking.event_create("hard_bounce", {})
+        incremental = stats_obj._stats_get([address])
+        self.assertEqual(incremental[address], {"opened": 1, "bounced": 1})
+        self.assertEqual(2, self.recipient.tracking_emails_count)
+        self.assertEqual(
+            self.recipient.email_score,
+            self.env["mail.tracking.email"].email_score_from_email(address),
+        )
+        # Incremental counters match a full rebuild
+        stats_obj._rebuild()
+        self.assertEqual(stats_obj._stats_get([address]), incremental)
+        tracking.sudo().unlink()
+        self.assertEqual(stats_obj._stats_get([address])[address], {"opened": 1})
+
+    def test_stats_daily(self):
+        stats_obj = self.env["mail.tracking.stats.daily"]
+        trackings = self.env["mail.tracking.email"]
+        for _i in range(3):
+            mail, tracking = self.mail_send(self.recipient.email)
+            trackings |= tracking
+        trackings.event_create("open", {"ua_family": "odoo", "os_family": "linux"})
+        stats_obj._rebuild()
+        domain = [("event_type", "=", "open"), ("ua_family", "=", "odoo")]
+        stats = stats_obj.search(domain)
+        self.assertEqual(len(stats), 1)
+        self.assertEqual(stats.count, 3)
+        self.assertEqual(stats.os_family, "linux")
+        # Only the new events are added on the next run
+        trackings.event_create("click", {"url": "https://www.example.com"})
+        stats_obj._cron_update()
+        self.assertEqual(stats.count, 3)
+        self.assertEqual(
+            sum(stats_obj.search([("event_type", "=", "click")]).mapped("count")), 3
+        )
+        self.assertEqual(
+            self.env["mail.tracking.checkpoint"]._checkpoint_get(
+                "mail_tracking.stats_daily_last_event_id"
+            ),
+            str(max(trackings.tracking_event_ids.ids)),
+        )
+        # Values containing separators don't share their counters
+        trackings[0].event_create("open", {"ua_family": "a|b", "os_family": "c"})
+        trackings[1].event_create("open", {"ua_family": "a", "os_family": "b|c"})
+        stats_obj._cron_update()
+        self.assertEqual(
+            stats_obj.search([("ua_family", "in", ["a|b", "a"])]).mapped("count"),
+            [1, 1],
+        )
+
+    def test_stats_daily_transactions_in_progress(self):
+        stats_obj = self.env["mail.tracking.stats.daily"]
+        mail, tracking = self.mail_send(self.recipient.email)
+        stats_obj._rebuild()
+        tracking.event_create("open", {"ua_family": "in-progress"})
+
+        def stats_count():
+            stats = stats_obj.search([("ua_family", "=", "in-progress")])
+            return sum(stats.mapped("count"))
+
+        stats_class = type(stats_obj)
+        method = "_stats_transactions_in_progress"
+        # Another transaction in progress could still add events below the
+        # last one, so it isn't counted yet
+        with patch.object(stats_class, method, return_value={-1}):
+            stats_obj._cron_update()
+        self.assertEqual(stats_count(), 0)
+        tracking.event_create("open", {"ua_family": "in-progress"})
+        with patch.object(stats_class, method, return_value={-1, -2}):
+            stats_obj._cron_update()
+        self.assertEqual(stats_count(), 0)
+        # Once that transaction is over, the events sampled by the first run
+        # are final, but not the next ones while the second one is in progress
+        with patch.object(stats_class, method, return_value={-2}):
+            stats_obj._cron_update()
+        self.assertEqual(stats_count(), 1)
+        stats_obj._cron_update()
+        self.assertEqual(stats_count(), 2)
+
+    def test_export(self):
+        trackings = self.env["mail.tracking.email"]
+        for _i in range(5):
+            mail, tracking = self.mail_send(self.recipient.email)
+            trackings |= tracking
+        trackings[:2].event_create("open", {})
+        export = self.env["mail.tracking.export"].create(
+            {"res_model": "mail.tracking.email", "state": "opened"}
+        )
+        # Chunks smaller than the exported volume
+        data = b"".join(export._export_csv(chunk_size=1)).decode()
+        rows = list(csv.reader(io.StringIO(data)))
+        self.assertEqual(rows[0], export._export_columns())
+        self.assertEqual(sorted(int(x[0]) for x in rows[1:]), sorted(trackings[:2].ids))
+        export.write({"res_model": "mail.tracking.event", "event_type": "open"})
+        fileobj = io.BytesIO()
+        export.export_to_file(fileobj)
+        rows = list(csv.reader(io.StringIO(fileobj.getvalue().decode())))
+        tracking_index = rows[0].index("tracking_email_id")
+        self.assertEqual(
+            sorted(int(x[tracking_index]) for x in rows[1:]), sorted(trackings[:2].ids)
+        )
+        self.assertEqual(export.action_export()["type"], "ir.actions.act_url")
+
+    def test_archive(self):
+        archive_obj = self.env["mail.tracking.email.archive"]
+        stats_obj = self.env["mail.tracking.address.stats"]
+        address = self.recipient.email
+        mail, tracking = self.mail_send(address)
+        tracking.event_create("open", {})
+        mail, tracking2 = self.mail_send(address)
+        (tracking | tracking2).write({"time": "2000-01-01 00:00:00"})
+        score = self.recipient.email_score
+        stats = stats_obj._stats_get([address])
+        # Archiving is disabled by default
+        self.assertFalse(archive_obj._cron_archive())
+        icp = self.env["ir.config_parameter"]
+        icp.set_param("mail_tracking.retention_months", 12)
+        icp.set_param("mail_tracking.retention_months.opened", 0)
+        self.assertEqual(archive_obj._cron_archive(), 1)
+        self.assertTrue(tracking.exists())
+        self.assertFalse(tracking2.exists())
+        archived = archive_obj.browse(tracking2.id)
+        self.assertEqual(archived.state, "sent")
+        self.assertEqual(archived.recipient_address, address)
+        self.assertEqual(archived.tracking_event_ids.event_type, "sent")
+        # The reputation of the address doesn't change
+        self.recipient.invalidate_recordset()
+        self.assertEqual(self.recipient.email_score, score)
+        stats_obj._rebuild()
+        self.assertEqual(stats_obj._stats_get([address]), stats)
+
+    def test_archive_failed_message(self):
+        archive_obj = self.env["mail.tracking.email.archive"]
+        mail, tracking = self.mail_send(self.recipient.email)
+        message = self.env["mail.message"].create(
+            {"body": "Failed message", "mail_tracking_needs_action": True}
+        )
+        tracking.write(
+            {
+                "mail_message_id": message.id,
+                "state": "bounced",
+                "time": "2000-01-01 00:00:00",
+            }
+        )
+        self.assertTrue(message.mail_tracking_failed)
+        self.env["ir.config_parameter"].set_param("mail_tracking.retention_months", 12)
+        self.assertEqual(archive_obj._cron_archive(), 1)
+        self.assertFalse(message.mail_tracking_failed)
+
     def test_recordset_email_score(self):
         """For backwords compatibility sake"""
         trackings = self.env["mail.tracking.email"]
@@ -670,6 +1266,66 @@ class TestMailTracking(TransactionCase):
                 "data-odoo-tracking-email not found", tracking.error_description
             )
 
+    def test_tracking_img_parse(self):
+        server = self.env["ir.mail_server"]
+        img = '<img src="/blank.gif" data-odoo-tracking-email="%s" alt="" />'
+        body = "<div>%s<p><img src='a.png'/>%s</p>%s</div>" % (
+            "<p>Lorem ipsum</p>" * 12000,
+            img % "12",
+            img % "13",
+        )
+        self.assertGreater(len(body), 200000)
+        # The 200 KB body is scanned with string searches, the regular
+        # expression is only matched at the two tracking images
+        with patch(
+            "odoo.addons.mail_tracking.tools.TRACKING_IMG_RE", wraps=TRACKING_IMG_RE
+        ) as mock_re:
+            self.assertEqual(server._tracking_email_id_body_get(body), "12")
+        self.assertEqual(mock_re.match.call_count, 2)
+        self.assertEqual(
+            server._tracking_img_remove(body),
+            "<div>%s<p><img src='a.png'/></p></div>" % ("<p>Lorem ipsum</p>" * 12000),
+        )
+        self.assertFalse(server._tracking_email_id_body_get(img % ""))
+        self.assertFalse(server._tracking_email_id_body_get(False))
+        self.assertEqual(server._tracking_img_remove("<p>Test</p>"), "<p>Test</p>")
+
+    def test_ttl_cache(self):
+        now = [1000.0]
+        with patch(
+            "odoo.addons.mail_tracking.tools.time.monotonic", side_effect=lambda: now[0]
+        ):
+            cache = TTLCache(2, 10)
+            cache.set("a", 1)
+            now[0] += 5
+            cache.set("b", 2)
+            # Reading an entry doesn't delay its eviction
+            self.assertEqual(cache.get("a"), 1)
+            now[0] += 2
+            cache.set("c", 3)
+            self.assertIsNone(cache.get("a"))
+            self.assertEqual(cache.get("b"), 2)
+            # Adding again an expired key makes it the last one to expire
+            now[0] += 8
+            self.assertIsNone(cache.get("b"))
+            self.assertTrue(cache.add("b"))
+            self.assertFalse(cache.add("b"))
+            self.assertEqual(cache.get("c"), 3)
+            cache.set("d", 4)
+            self.assertIsNone(cache.get("c"))
+            self.assertTrue(cache.get("b"))
+            self.assertEqual(cache.stats()["size"], 2)
+
+    def test_build_email_tracking_id_hook(self):
+        server = self.env["ir.mail_server"]
+        with patch.object(
+            type(server), "_tracking_email_id_body_get", return_value="99"
+        ):
+            msg = server.build_email(
+                "from@example.com", ["to@example.com"], "Subject", "<p>Test</p>"
+            )
+        self.assertEqual(msg["X-Odoo-MailTracking-ID"], "99")
+
     def test_mail_init_messaging(self):
         def mock_json_response(*args, **kwargs):
             return {"expected_result": True}
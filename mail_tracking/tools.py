@@ -0,0 +1,161 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from odoo.tools import email_normalize
+
+TRACKING_IMG_MARKER = "data-odoo-tracking-email="
+# https://regex101.com/r/lW4cB1/2
+TRACKING_IMG_RE = re.compile(
+    r'<img[^>]*data-odoo-tracking-email=["\']([0-9]*)["\'][^>]*>'
+)
+
+
+def email_address_normalize(email):
+    """Normalize an email address or a recipient header the same way as the
+    ``email_normalized`` fields, keeping the first address when there are
+    several ones.
+
+    It is used for all the ``recipient_address`` fields and the lookups on
+    them, so they can be compared to ``email_normalized`` with an index.
+
+    :return: the normalized address or False
+    """
+    return email_normalize(email, strict=False) if email else False
+
+
+class TTLCache:
+    """Small thread-safe cache whose entries expire ``ttl`` seconds after
+    being set. When it is full, the entries closest to their expiry are
+    evicted first.
+
+    It is meant to be stored in the registry so it is shared by all the
+    requests served by the same worker.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expire(self, now):
+        while self._data:
+            key, (expire, __) = next(iter(self._data.items()))
+            if expire > now:
+                break
+            del self._data[key]
+
+    def get(self, key, default=None):
+        """Return the value of ``key`` without updating the counters"""
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            expire, value = self._data.get(key, (0, default))
+            if expire <= now:
+                self._data.pop(key, None)
+                return default
+            return value
+
+    def set(self, key, value):
+        now = time.monotonic()
+        with self._lock:
+            self._data[key] = (now + self.ttl, value)
+            self._data.move_to_end(key)
+            self._expire(now)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def add(self, key, value=True):
+        """Set ``key`` unless it is already cached, atomically
+
+        :return: True if the key has been added
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            expire, __ = self._data.get(key, (0, None))
+            if expire > now:
+                return False
+            self._data[key] = (now + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+            return True
+
+    def discard(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+    def count(self, hit):
+        """Account a lookup in the hit/miss counters"""
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self):
+        with self._lock:
+            self._expire(time.monotonic())
+            return {
+                "size": len(self._data),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+def tracking_img_parse(body):
+    """Find the tracking images of an HTML body in a single pass.
+
+    The body is only scanned with plain string searches, the regular expression
+    is just matched at the start of the ``<img`` tags containing the marker.
+
+    :return: (tracking email id of the first image or False, list of the
+      (start, end) positions of the images)
+    """
+    tracking_email_id = False
+    spans = []
+    pos = body.find(TRACKING_IMG_MARKER)
+    while pos >= 0:
+        start = body.rfind("<img", 0, pos)
+        match = (
+            start >= 0
+            and body.find(">", start, pos) < 0
+            and TRACKING_IMG_RE.match(body, start)
+        )
+        if match:
+            if not spans:
+                tracking_email_id = match.group(1) or False
+            spans.append(match.span())
+            pos = match.end()
+        else:
+            pos += len(TRACKING_IMG_MARKER)
+        pos = body.find(TRACKING_IMG_MARKER, pos)
+    return tracking_email_id, spans
+
+
+def tracking_img_remove(body):
+    """Remove the tracking images from an HTML body"""
+    spans = tracking_img_parse(body)[1]
+    if not spans:
+        return body
+    parts = []
+    pos = 0
+    for start, end in spans:
+        parts.append(body[pos:start])
+        pos = end
+    parts.append(body[pos:])
+    return "".join(parts)
@@ -0,0 +1,225 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+import csv
+import io
+import logging
+import tempfile
+
+from odoo import api, fields, models
+from odoo.osv import expression
+
+_logger = logging.getLogger(__name__)
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # pragma: no cover
+    pyarrow = None
+
+# Rows read from the database per query
+EXPORT_CHUNK_SIZE = 10000
+# Bytes read per iteration when streaming an export file
+EXPORT_BUFFER_SIZE = 1 << 20
+
+PARQUET_TYPES = {
+    "boolean": "bool_",
+    "date": "date32",
+    "float": "float64",
+    "integer": "int64",
+    "many2one": "int64",
+    "monetary": "float64",
+}
+
+
+class MailTrackingExport(models.TransientModel):
+    """Export trackings or their events for analytics.
+
+    Rows are read from the database by chunks of consecutive ids, and written
+    to the output as soon as they are read, so the memory used doesn't depend
+    on the exported volume.
+    """
+
+    _name = "mail.tracking.export"
+    _description = "MailTracking export"
+
+    res_model = fields.Selection(
+        selection=[
+            ("mail.tracking.email", "Tracking emails"),
+            ("mail.tracking.event", "Tracking events"),
+        ],
+        string="Export",
+        required=True,
+        default="mail.tracking.event",
+    )
+    date_from = fields.Datetime()
+    date_to = fields.Datetime()
+    state = fields.Selection(selection="_selection_state", string="Tracking state")
+    event_type = fields.Selection(selection="_selection_event_type")
+    file_format = fields.Selection(
+        selection="_selection_file_format", required=True, default="csv"
+    )
+
+    @api.model
+    def _selection_state(self):
+        field = self.env["mail.tracking.email"]._fields["state"]
+        return field._description_selection(self.env)
+
+    @api.model
+    def _selection_event_type(self):
+        field = self.env["mail.tracking.event"]._fields["event_type"]
+        return field._description_selection(self.env)
+
+    @api.model
+    def _selection_file_format(self):
+        selection = [("csv", "CSV")]
+        if pyarrow:
+            selection.append(("parquet", "Parquet"))
+        return selection
+
+    def _export_domain(self):
+        self.ensure_one()
+        domain = []
+        if self.date_from:
+            domain.append(("time", ">=", self.date_from))
+        if self.date_to:
+            domain.append(("time", "<=", self.date_to))
+        if self.res_model == "mail.tracking.email":
+            if self.state:
+                domain.append(("state", "=", self.state))
+        else:
+            if self.state:
+                domain.append(("tracking_email_id.state", "=", self.state))
+            if self.event_type:
+                domain.append(("event_type", "=", self.event_type))
+        return domain
+
+    def _export_columns(self):
+        """Stored fields exported, starting with the id"""
+        self.ensure_one()
+        model_fields = self.env[self.res_model]._fields
+        return ["id"] + [
+            name
+            for name, field in model_fields.items()
+            if name != "id"
+            and field.store
+            and field.column_type
+            and field.type != "binary"
+        ]
+
+    def _export_filename(self):
+        self.ensure_one()
+        return "%s_%s.%s" % (
+            self.res_model.replace(".", "_"),
+            fields.Date.context_today(self).strftime("%Y%m%d"),
+            self.file_format,
+        )
+
+    def _export_mimetype(self):
+        self.ensure_one()
+        if self.file_format == "parquet":
+            return "application/vnd.apache.parquet"
+        return "text/csv"
+
+    def _export_chunks(self, chunk_size=EXPORT_CHUNK_SIZE):
+        """Yield the rows to export by chunks.
+
+        Each query starts after the last id of the previous chunk, so it only
+        reads the next rows from the primary key index whatever the offset.
+        """
+        self.ensure_one()
+        model = self.env[self.res_model]
+        model.flush_model()
+        columns = self._export_columns()
+        domain = self._export_domain()
+        last_id = 0
+        while True:
+            query = model._search(
+                expression.AND([domain, [("id", ">", last_id)]]),
+                limit=chunk_size,
+                order="id",
+            )
+            query_str, params = query.select(
+                *('"%s"."%s"' % (model._table, name) for name in columns)
+            )
+            self.env.cr.execute(query_str, params)
+            rows = self.env.cr.fetchall()
+            if rows:
+                yield rows
+            if len(rows) < chunk_size:
+                break
+            last_id = rows[-1][0]
+
+    def _export_csv(self, chunk_size=EXPORT_CHUNK_SIZE):
+        """Yield the CSV file by encoded chunks"""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(self._export_columns())
+        for rows in self._export_chunks(chunk_size=chunk_size):
+            writer.writerows(rows)
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode()
+
+    @api.model
+    def _export_parquet_type(self, field):
+        if field.type == "datetime":
+            return pyarrow.timestamp("us")
+        return getattr(pyarrow, PARQUET_TYPES.get(field.type, "string"))()
+
+    def _export_parquet_schema(self):
+        model_fields = self.env[self.res_model]._fields
+        return pyarrow.schema(
+            [
+                (name, self._export_parquet_type(model_fields[name]))
+                for name in self._export_columns()
+            ]
+        )
+
+    def _export_parquet(self, fileobj, chunk_size=EXPORT_CHUNK_SIZE):
+        """Write the export in Parquet format, one row group per chunk"""
+        schema = self._export_parquet_schema()
+        with pyarrow.parquet.ParquetWriter(fileobj, schema) as writer:
+            for rows in self._export_chunks(chunk_size=chunk_size):
+                writer.write_table(
+                    pyarrow.Table.from_arrays(
+                        [
+                            pyarrow.array(values, type=field.type)
+                            for values, field in zip(zip(*rows), schema)
+                        ],
+                        schema=schema,
+                    )
+                )
+
+    def export_to_file(self, fileobj):
+        """Write the export to a binary file object"""
+        self.ensure_one()
+        if self.file_format == "parquet":
+            self._export_parquet(fileobj)
+        else:
+            for data in self._export_csv():
+                fileobj.write(data)
+
+    def _export_stream(self):
+        """Yield the export file by chunks, to be sent in a streamed HTTP
+        response.
+        """
+        self.ensure_one()
+        _logger.info("Exporting %s (%s)", self.res_model, self._export_domain())
+        if self.file_format != "parquet":
+            yield from self._export_csv()
+            return
+        # The Parquet metadata is written at the end of the file
+        with tempfile.TemporaryFile() as fileobj:
+            self._export_parquet(fileobj)
+            fileobj.seek(0)
+            yield from iter(lambda: fileobj.read(EXPORT_BUFFER_SIZE), b"")
+
+    def action_export(self):
+        self.ensure_one()
+        return {
+            "type": "ir.actions.act_url",
+            "url": "/mail/tracking/export/%d" % self.id,
+            "target": "self",
+        }
@@ -6,7 +6,7 @@
 {
     "name": "Mail tracking for Mailgun",
     "summary": "Mail tracking and Mailgun webhooks integration",
-    "version": "16.0.1.0.1",
+    "version": "16.0.1.1.0",
     "category": "Social Network",
     "website": "https://github.com/OCA/social",
     "author": "Tecnativa, Odoo Community Association (OCA)",
@@ -15,6 +15,8 @@
     "installable": True,
     "depends": ["mail_tracking"],
     "data": [
+        "data/mail_tracking_mailgun_cron.xml",
+        "security/ir.model.access.csv",
         "views/res_partner.xml",
         "views/mail_tracking_email.xml",
         "wizards/res_config_settings_views.xml",
@@ -4,20 +4,25 @@
 import hashlib
 import hmac
 import logging
+import threading
 from datetime import datetime, timedelta
 
 from werkzeug.exceptions import NotAcceptable
 
-from odoo import _
+from odoo import _, tools
 from odoo.exceptions import ValidationError
 from odoo.http import request, route
 
 from odoo.addons.web.controllers.utils import ensure_db
 
 from ...mail_tracking.controllers import main
+from ..models.mail_tracking_mailgun_token import MAILGUN_REPLAY_WINDOW
 
 _logger = logging.getLogger(__name__)
 
+# Events of the batch route processed per transaction
+MAILGUN_BATCH_CHUNK_SIZE = 500
+
 
 class MailTrackingController(main.MailTrackingController):
     def _mail_tracking_mailgun_webhook_verify(self, timestamp, token, signature):
@@ -27,20 +32,9 @@ class MailTrackingController(main.MailTrackingController):
         """  # noqa: E501
         # Request cannot be old
         processing_time = datetime.utcnow() - datetime.utcfromtimestamp(int(timestamp))
-        if not timedelta() < processing_time < timedelta(minutes=10):
+        max_time = timedelta(seconds=MAILGUN_REPLAY_WINDOW)
+        if not timedelta() < processing_time < max_time:
             raise ValidationError(_("Request is too old"))
-        # Avoid replay attacks
-        try:
-            processed_tokens = (
-                request.env.registry._mail_tracking_mailgun_processed_tokens
-            )
-        except AttributeError:
-            processed_tokens = (
-                request.env.registry._mail_tracking_mailgun_processed_tokens
-            ) = set()
-        if token in processed_tokens:
-            raise ValidationError(_("Request was already processed"))
-        processed_tokens.add(token)
         params = request.env["mail.tracking.email"]._mailgun_values()
         # Assert signature
         if not params.webhook_signing_key:
@@ -48,15 +42,35 @@ class MailTrackingController(main.MailTrackingController):
                 "Skipping webhook payload verification. "
                 "Set `mailgun.webhook_signing_key` config parameter to enable"
             )
-            return
+        else:
+            self._mail_tracking_mailgun_signature_verify(
+                params.webhook_signing_key, timestamp, token, signature
+            )
+        # Avoid replay attacks. Only the tokens of signed requests are stored,
+        # so forged ones can't evict them from the store.
+        token_model = request.env["mail.tracking.mailgun.token"].sudo()
+        if not token_model._token_register(token, timestamp):
+            raise ValidationError(_("Request was already processed"))
+
+    def _mail_tracking_mailgun_signature_verify(
+        self, signing_key, timestamp, token, signature
+    ):
         hmac_digest = hmac.new(
-            key=params.webhook_signing_key.encode(),
+            key=signing_key.encode(),
             msg=("{}{}".format(timestamp, token)).encode(),
             digestmod=hashlib.sha256,
         ).hexdigest()
         if not hmac.compare_digest(str(signature), str(hmac_digest)):
             raise ValidationError(_("Wrong signature"))
 
+    def _mail_tracking_mailgun_webhook_queue(self):
+        """Store webhook payloads in the event queue instead of processing them"""
+        return tools.str2bool(
+            request.env["ir.config_parameter"]
+            .sudo()
+            .get_param("mailgun.webhook_queue", "False")
+        )
+
     @route(["/mail/tracking/mailgun/all"], auth="none", type="json", csrf=False)
     def mail_tracking_mailgun_webhook(self):
         """Process webhooks from Mailgun."""
@@ -69,8 +83,135 @@ class MailTrackingController(main.MailTrackingController):
             )
         except ValidationError as error:
             raise NotAcceptable from error
-        # Process event
+        # Queue the event to be processed later, or process it right away
+        if self._mail_tracking_mailgun_webhook_queue():
+            request.env["mail.tracking.event.queue"].sudo()._enqueue(
+                "mailgun",
+                [
+                    {
+                        "event-data": request.dispatcher.jsonrequest["event-data"],
+                        "metadata": self._request_metadata(),
+                    }
+                ],
+            )
+            return
         request.env["mail.tracking.email"].sudo()._mailgun_event_process(
             request.dispatcher.jsonrequest["event-data"],
             self._request_metadata(),
         )
+
+    def _mail_tracking_mailgun_batch_process(self, events_data, metadata):
+        """Import a chunk of events in a single transaction, or one by one if
+        it fails.
+
+        :return: dictionary {mailgun id: status}
+        """
+        env = request.env
+        tracking_model = env["mail.tracking.email"].sudo()
+        statuses = {}
+        try:
+            with env.cr.savepoint():
+                created = tracking_model._mailgun_events_process(events_data, metadata)
+            chunks = [(events_data, created)]
+        except Exception:
+            _logger.warning(
+                "Batch of %d Mailgun events failed, retrying one by one",
+                len(events_data),
+                exc_info=True,
+            )
+            env.invalidate_all()
+            chunks = []
+            for event_data in events_data:
+                try:
+                    with env.cr.savepoint():
+                        created = tracking_model._mailgun_events_process(
+                            [event_data], metadata
+                        )
+                    chunks.append(([event_data], created))
+                except Exception as error:
+                    _logger.warning("Mailgun event %s failed: %s", event_data, error)
+                    env.invalidate_all()
+                    statuses[event_data["id"]] = "error"
+        for chunk_events_data, created in chunks:
+            created_ids = set(created.mapped("mailgun_id"))
+            for event_data in chunk_events_data:
+                statuses[event_data["id"]] = (
+                    "created" if event_data["id"] in created_ids else "skipped"
+                )
+        return statuses
+
+    @route(["/mail/tracking/mailgun/batch"], auth="none", type="json", csrf=False)
+    def mail_tracking_mailgun_webhook_batch(self):
+        """Import several signed Mailgun events at once, e.g. to backfill the
+        events stored by a relay during an outage.
+
+        The request contains an ``events`` list of the payloads sent by the
+        Mailgun webhooks, each with its ``signature`` and ``event-data``.
+        Signatures are verified, but not their age nor their token, as the
+        events are imported only once anyway.
+
+        :return: list of {"id": mailgun id, "status": status}, the status being
+          "rejected" (malformed or wrong signature), "queued", "created",
+          "skipped" (already imported or not for this database) or "error"
+        """
+        ensure_db()
+        env = request.env
+        params = env["mail.tracking.email"].sudo()._mailgun_values()
+        if not params.webhook_signing_key:
+            _logger.warning(
+                "Mailgun batch webhook refused: "
+                "set `mailgun.webhook_signing_key` config parameter to enable it"
+            )
+            raise NotAcceptable()
+        payloads = request.dispatcher.jsonrequest.get("events", [])
+        if not isinstance(payloads, list):
+            raise NotAcceptable()
+        # Mailgun id of each payload, with its status if it is malformed
+        items = []
+        statuses = {}
+        accepted = []
+        for payload in payloads:
+            values = payload if isinstance(payload, dict) else {}
+            event_data = values.get("event-data")
+            signature = values.get("signature")
+            mailgun_id = event_data.get("id") if isinstance(event_data, dict) else None
+            if not isinstance(mailgun_id, str) or not isinstance(signature, dict):
+                _logger.warning("Malformed Mailgun batch event: %s", payload)
+                items.append((mailgun_id, "rejected"))
+                continue
+            items.append((mailgun_id, None))
+            try:
+                self._mail_tracking_mailgun_signature_verify(
+                    params.webhook_signing_key,
+                    signature.get("timestamp"),
+                    signature.get("token"),
+                    signature.get("signature"),
+                )
+            except ValidationError:
+                statuses[mailgun_id] = "rejected"
+                continue
+            accepted.append(event_data)
+        metadata = self._request_metadata()
+        testing = getattr(threading.current_thread(), "testing", False)
+        queue = self._mail_tracking_mailgun_webhook_queue()
+        for start in range(0, len(accepted), MAILGUN_BATCH_CHUNK_SIZE):
+            chunk = accepted[start : start + MAILGUN_BATCH_CHUNK_SIZE]
+            if queue:
+                env["mail.tracking.event.queue"].sudo()._enqueue(
+                    "mailgun",
+                    [
+                        {"event-data": event_data, "metadata": metadata}
+                        for event_data in chunk
+                    ],
+                )
+                statuses.update({event_data["id"]: "queued" for event_data in chunk})
+            else:
+                statuses.update(
+                    self._mail_tracking_mailgun_batch_process(chunk, metadata)
+                )
+            if not testing:
+                env.cr.commit()  # pylint: disable=invalid-commit
+        return [
+            {"id": mailgun_id, "status": status or statuses[mailgun_id]}
+            for mailgun_id, status in items
+        ]
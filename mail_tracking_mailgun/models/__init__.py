@@ -3,4 +3,6 @@
 from . import ir_mail_server
 from . import mail_tracking_email
 from . import mail_tracking_event
+from . import mail_tracking_event_queue
 from . import res_partner
+from . import mail_tracking_mailgun_token
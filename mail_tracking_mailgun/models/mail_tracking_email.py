@@ -4,20 +4,29 @@
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 
 import logging
+import threading
+import time
 from collections import namedtuple
 from datetime import datetime
 from urllib.parse import urljoin
 
 import requests
 
-from odoo import _, api, fields, models
+from odoo import _, api, fields, models, tools
 from odoo.exceptions import UserError, ValidationError
-from odoo.tools import email_split
 
 from ..wizards.res_config_settings import MAILGUN_TIMEOUT
 
 _logger = logging.getLogger(__name__)
 
+MAILGUN_EVENTS_CHECKPOINT = "mailgun.events_checkpoint"
+# Mailgun advises not to poll the events of the last half hour, as they may
+# not be searchable yet
+MAILGUN_EVENTS_DELAY = 1800  # seconds
+# How far back the first synchronization goes
+MAILGUN_EVENTS_FIRST_SYNC = 86400  # seconds
+MAILGUN_EVENTS_PAGE_SIZE = 300
+
 MailgunParameters = namedtuple(
     "MailgunParameters",
     (
@@ -27,6 +36,7 @@ MailgunParameters = namedtuple(
         "validation_key",
         "webhooks_domain",
         "webhook_signing_key",
+        "timeout",
     ),
 )
 
@@ -72,7 +82,11 @@ class MailTrackingEmail(models.Model):
         return equivalents.get(event.get("event"), default)
 
     @api.model
+    @tools.ormcache()
     def _mailgun_values(self):
+        """Mailgun connection parameters, cached until a system parameter
+        changes.
+        """
         icp = self.env["ir.config_parameter"].sudo()
         api_key = icp.get_param("mailgun.apikey")
         if not api_key:
@@ -86,6 +100,7 @@ class MailTrackingEmail(models.Model):
         web_base_url = icp.get_param("web.base.url")
         webhooks_domain = icp.get_param("mailgun.webhooks_domain", web_base_url)
         webhook_signing_key = icp.get_param("mailgun.webhook_signing_key")
+        timeout = float(icp.get_param("mailgun.timeout", MAILGUN_TIMEOUT))
         return MailgunParameters(
             api_key,
             api_url,
@@ -93,6 +108,7 @@ class MailTrackingEmail(models.Model):
             validation_key,
             webhooks_domain,
             webhook_signing_key,
+            timeout,
         )
 
     def _mailgun_metadata(self, mailgun_event_type, event, metadata):
@@ -162,11 +178,15 @@ class MailTrackingEmail(models.Model):
         return metadata
 
     @api.model
-    def _mailgun_event_process(self, event_data, metadata):
-        """Retrieve (and maybe create) mailgun event from API data payload.
+    def _mailgun_event_prepare(self, event_data, metadata):
+        """Convert a mailgun event API data payload to the arguments of
+        ``event_create_batch``.
 
         In https://documentation.mailgun.com/en/latest/api-events.html#event-structure
         you can read the event payload format as obtained from webhooks or calls to API.
+
+        :return: a (tracking_email_id, event_type, metadata) tuple or None if the
+          event must be ignored
         """
         # Just ignore these events, as they will be from another system using the same
         # smtp domain
@@ -180,24 +200,15 @@ class MailTrackingEmail(models.Model):
                 f"received in DB {self.env.cr.dbname}: {event_data}"
             )
             return
-        # Do nothing if event was already processed
         mailgun_id = event_data["id"]
-        db_event = self.env["mail.tracking.event"].search(
-            [("mailgun_id", "=", mailgun_id)], limit=1
-        )
-        if db_event:
-            _logger.debug("Mailgun event already found in DB: %s", mailgun_id)
-            return db_event
-        # Do nothing if tracking email for event is not found
         message_id = event_data["message"]["headers"]["message-id"]
         recipient = event_data["recipient"]
-        tracking_email = self.browse(
-            int(event_data["user-variables"]["tracking_email_id"])
-        )
+        tracking_email_id = int(event_data["user-variables"]["tracking_email_id"])
         mailgun_event_type = event_data["event"]
-        # Process event
         state = self._mailgun_event2type(event_data, mailgun_event_type)
-        metadata = self._mailgun_metadata(mailgun_event_type, event_data, metadata)
+        metadata = self._mailgun_metadata(
+            mailgun_event_type, event_data, dict(metadata)
+        )
         _logger.info(
             "Importing mailgun event %s (%s message %s for %s)",
             mailgun_id,
@@ -205,7 +216,45 @@ class MailTrackingEmail(models.Model):
             message_id,
             recipient,
         )
-        tracking_email.event_create(state, metadata)
+        return tracking_email_id, state, metadata
+
+    @api.model
+    def _mailgun_events_process(self, events_data, metadata):
+        """Import several mailgun events at once
+
+        Already imported events are discarded with a single query and the rest
+        are created through ``event_create_batch``.
+        """
+        mailgun_ids = [event_data["id"] for event_data in events_data]
+        already = set(
+            self.env["mail.tracking.event"]
+            .search([("mailgun_id", "in", mailgun_ids)])
+            .mapped("mailgun_id")
+        )
+        events = []
+        for event_data in events_data:
+            # Do nothing if event was already processed
+            if event_data["id"] in already:
+                _logger.debug("Mailgun event already found in DB: %s", event_data["id"])
+                continue
+            event = self._mailgun_event_prepare(event_data, metadata)
+            if event:
+                already.add(event_data["id"])
+                events.append(event)
+        if not events:
+            return self.env["mail.tracking.event"]
+        return self.event_create_batch(events)
+
+    @api.model
+    def _mailgun_event_process(self, event_data, metadata):
+        """Retrieve (and maybe create) mailgun event from API data payload."""
+        db_event = self.env["mail.tracking.event"].search(
+            [("mailgun_id", "=", event_data["id"])], limit=1
+        )
+        if db_event:
+            _logger.debug("Mailgun event already found in DB: %s", event_data["id"])
+            return db_event
+        return self._mailgun_events_process([event_data], metadata)
 
     def action_manual_check_mailgun(self):
         """Manual check against Mailgun API
@@ -213,12 +262,9 @@ class MailTrackingEmail(models.Model):
         API Documentation:
         https://documentation.mailgun.com/en/latest/api-events.html
         """
-        timeout = (
-            self.env["ir.config_parameter"]
-            .sudo()
-            .get_param("mailgun.timeout", MAILGUN_TIMEOUT)
-        )
-        api_key, api_url, domain, *__ = self._mailgun_values()
+        params = self._mailgun_values()
+        api_key, api_url, domain, *__ = params
+        timeout = params.timeout
         for tracking in self.filtered("message_id"):
             message_id = tracking.message_id.replace("<", "").replace(">", "")
             events = []
@@ -227,7 +273,7 @@ class MailTrackingEmail(models.Model):
                 "begin": tracking.timestamp,
                 "ascending": "yes",
                 "message-id": message_id,
-                "recipient": email_split(tracking.recipient)[0],
+                "recipient": tracking.recipient_address,
             }
             while url:
                 res = requests.get(
@@ -247,5 +293,83 @@ class MailTrackingEmail(models.Model):
                 url = res.json().get("paging", {}).get("next")
             if not events:
                 raise UserError(_("Event information not longer stored"))
-            for event in events:
-                self.sudo()._mailgun_event_process(event, {})
+            self.sudo()._mailgun_events_process(events, {})
+
+    @api.model
+    def _mailgun_events_sync_filter(self, events_data):
+        """Keep the events sent from this database for existing trackings"""
+        events_data = [
+            event_data
+            for event_data in events_data
+            if (event_data.get("user-variables") or {}).get("odoo_db")
+            == self.env.cr.dbname
+            and str(event_data["user-variables"].get("tracking_email_id")).isdigit()
+        ]
+        existing_ids = set(
+            self.browse(
+                {int(x["user-variables"]["tracking_email_id"]) for x in events_data}
+            )
+            .exists()
+            .ids
+        )
+        return [
+            event_data
+            for event_data in events_data
+            if int(event_data["user-variables"]["tracking_email_id"]) in existing_ids
+        ]
+
+    @api.model
+    def _cron_mailgun_events_sync(self):
+        """Import all the events of the Mailgun domain since the last run.
+
+        Events are paginated with a single HTTP session, and each page is
+        imported in a batch and committed with the timestamp of its last event
+        as checkpoint, so an interrupted synchronization resumes from there.
+
+        API Documentation:
+        https://documentation.mailgun.com/en/latest/api-events.html
+        """
+        icp = self.env["ir.config_parameter"].sudo()
+        if not icp.get_param("mailgun.apikey"):
+            return
+        params = self._mailgun_values()
+        api_key, api_url, domain, *__ = params
+        timeout = params.timeout
+        now = time.time()
+        end = now - MAILGUN_EVENTS_DELAY
+        checkpoint_obj = self.env["mail.tracking.checkpoint"].sudo()
+        begin = float(checkpoint_obj._checkpoint_get(MAILGUN_EVENTS_CHECKPOINT, 0))
+        begin = begin or now - MAILGUN_EVENTS_FIRST_SYNC
+        if begin >= end:
+            return
+        testing = getattr(threading.current_thread(), "testing", False)
+        url = urljoin(api_url, "/v3/%s/events" % domain)
+        params = {
+            "begin": begin,
+            "end": end,
+            "ascending": "yes",
+            "limit": MAILGUN_EVENTS_PAGE_SIZE,
+        }
+        with requests.Session() as session:
+            session.auth = ("api", api_key)
+            while url:
+                res = session.get(url, params=params, timeout=timeout)
+                if not res or res.status_code != 200:
+                    raise UserError(_("Couldn't retrieve Mailgun information"))
+                data = res.json()
+                events_data = data.get("items", [])
+                if not events_data:
+                    break
+                _logger.debug("Importing a page of %d Mailgun events", len(events_data))
+                self.sudo()._mailgun_events_process(
+                    self._mailgun_events_sync_filter(events_data), {}
+                )
+                checkpoint_obj._checkpoint_set(
+                    MAILGUN_EVENTS_CHECKPOINT, events_data[-1]["timestamp"]
+                )
+                if not testing:
+                    self.env.cr.commit()  # pylint: disable=invalid-commit
+                # The next page URL already contains the query parameters
+                url = data.get("paging", {}).get("next")
+                params = None
+        checkpoint_obj._checkpoint_set(MAILGUN_EVENTS_CHECKPOINT, end)
@@ -0,0 +1,27 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+import json
+from collections import defaultdict
+
+from odoo import fields, models
+
+
+class MailTrackingEventQueue(models.Model):
+    _inherit = "mail.tracking.event.queue"
+
+    source = fields.Selection(
+        selection_add=[("mailgun", "Mailgun webhook")],
+        ondelete={"mailgun": "cascade"},
+    )
+
+    def _process_mailgun(self):
+        """Import queued Mailgun webhook payloads, grouped by request metadata"""
+        events_by_metadata = defaultdict(list)
+        for item in self:
+            payload = json.loads(item.payload)
+            metadata = json.dumps(payload.get("metadata", {}), sort_keys=True)
+            events_by_metadata[metadata].append(payload["event-data"])
+        for metadata, events_data in events_by_metadata.items():
+            self.env["mail.tracking.email"].sudo()._mailgun_events_process(
+                events_data, json.loads(metadata)
+            )
@@ -0,0 +1,85 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+import time
+
+from odoo import api, fields, models, tools
+
+from odoo.addons.mail_tracking.tools import TTLCache
+
+# Mailgun webhooks are only accepted during this number of seconds after
+# their timestamp, so their tokens don't need to be kept any longer
+MAILGUN_REPLAY_WINDOW = 600
+MAILGUN_REPLAY_CACHE_SIZE = 100000  # tokens
+
+
+class MailTrackingMailgunToken(models.Model):
+    """Tokens of the Mailgun webhooks already processed, used to reject
+    replayed requests.
+
+    By default they are only kept in the memory of each worker. Setting the
+    ``mailgun.replay_store`` system parameter to ``database`` stores them in
+    this table instead, so a replay is rejected whatever the worker receiving
+    it.
+    """
+
+    _name = "mail.tracking.mailgun.token"
+    _description = "MailTracking Mailgun webhook token"
+    _log_access = False
+
+    token = fields.Char(required=True, readonly=True)
+    expire = fields.Float(
+        readonly=True,
+        index=True,
+        help="UTC timestamp after which the webhook is too old to be accepted",
+    )
+
+    def init(self):
+        tools.create_unique_index(
+            self._cr, "mail_tracking_mailgun_token_token_uniq", self._table, ["token"]
+        )
+
+    @api.model
+    def _replay_store(self):
+        return (
+            self.env["ir.config_parameter"]
+            .sudo()
+            .get_param("mailgun.replay_store", "memory")
+        )
+
+    @api.model
+    def _memory_tokens(self):
+        registry = self.env.registry
+        try:
+            return registry._mail_tracking_mailgun_processed_tokens
+        except AttributeError:
+            tokens = registry._mail_tracking_mailgun_processed_tokens = TTLCache(
+                MAILGUN_REPLAY_CACHE_SIZE, MAILGUN_REPLAY_WINDOW
+            )
+            return tokens
+
+    @api.model
+    def _token_register(self, token, timestamp):
+        """Register the token of a webhook
+
+        :return: False if the token has already been registered
+        """
+        if self._replay_store() != "database":
+            return self._memory_tokens().add(token)
+        # Concurrent requests with the same token wait for each other on the
+        # unique index, and only the first one to commit inserts it
+        self.env.cr.execute(
+            """
+            INSERT INTO mail_tracking_mailgun_token (token, expire)
+            VALUES (%s, %s)
+            ON CONFLICT (token) DO NOTHING
+            """,
+            (token, float(timestamp) + MAILGUN_REPLAY_WINDOW),
+        )
+        return bool(self.env.cr.rowcount)
+
+    @api.autovacuum
+    def _gc_expired_tokens(self):
+        self.env.cr.execute(
+            "DELETE FROM mail_tracking_mailgun_token WHERE expire < %s",
+            (time.time(),),
+        )
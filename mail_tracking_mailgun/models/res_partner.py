@@ -4,14 +4,26 @@
 # Copyright 2017 Tecnativa - David Vidal
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
 
+import logging
+import threading
 from urllib.parse import urljoin
 
 import requests
 
-from odoo import SUPERUSER_ID, _, models
+from odoo import SUPERUSER_ID, _, api, models
 from odoo.exceptions import UserError
+from odoo.tools.safe_eval import safe_eval
 
-from ..wizards.res_config_settings import MAILGUN_TIMEOUT
+from ..tools import TokenBucket, requests_concurrent
+
+_logger = logging.getLogger(__name__)
+
+# Partners checked per transaction by the bulk checks
+MAILGUN_BULK_BATCH_SIZE = 500
+# Default number of concurrent requests and of requests per second
+MAILGUN_BULK_WORKERS = 8
+MAILGUN_RATE_LIMIT = 10
+MAILGUN_BULK_CHECKPOINT = "mailgun.bulk_check_last_partner_id"
 
 
 class ResPartner(models.Model):
@@ -51,11 +63,7 @@ class ResPartner(models.Model):
         https://documentation.mailgun.com/en/latest/api-email-validation.html
         """
         params = self.env["mail.tracking.email"]._mailgun_values()
-        timeout = (
-            self.env["ir.config_parameter"]
-            .sudo()
-            .get_param("mailgun.timeout", MAILGUN_TIMEOUT)
-        )
+        timeout = params.timeout
         if not params.validation_key:
             raise UserError(
                 _(
@@ -137,14 +145,9 @@ class ResPartner(models.Model):
         API documentation:
         https://documentation.mailgun.com/en/latest/api-suppressions.html
         """
-        api_key, api_url, domain, *__ = self.env[
-            "mail.tracking.email"
-        ]._mailgun_values()
-        timeout = (
-            self.env["ir.config_parameter"]
-            .sudo()
-            .get_param("mailgun.timeout", MAILGUN_TIMEOUT)
-        )
+        params = self.env["mail.tracking.email"]._mailgun_values()
+        api_key, api_url, domain, *__ = params
+        timeout = params.timeout
         for partner in self:
             res = requests.get(
                 urljoin(api_url, "/v3/%s/bounces/%s" % (domain, partner.email)),
@@ -162,14 +165,9 @@ class ResPartner(models.Model):
         API documentation:
         https://documentation.mailgun.com/en/latest/api-suppressions.html
         """
-        api_key, api_url, domain, *__ = self.env[
-            "mail.tracking.email"
-        ]._mailgun_values()
-        timeout = (
-            self.env["ir.config_parameter"]
-            .sudo()
-            .get_param("mailgun.timeout", MAILGUN_TIMEOUT)
-        )
+        params = self.env["mail.tracking.email"]._mailgun_values()
+        api_key, api_url, domain, *__ = params
+        timeout = params.timeout
         for partner in self:
             res = requests.post(
                 urljoin(api_url, "/v3/%s/bounces" % domain),
@@ -185,14 +183,9 @@ class ResPartner(models.Model):
         API documentation:
         https://documentation.mailgun.com/en/latest/api-suppressions.html
         """
-        api_key, api_url, domain, *__ = self.env[
-            "mail.tracking.email"
-        ]._mailgun_values()
-        timeout = (
-            self.env["ir.config_parameter"]
-            .sudo()
-            .get_param("mailgun.timeout", MAILGUN_TIMEOUT)
-        )
+        params = self.env["mail.tracking.email"]._mailgun_values()
+        api_key, api_url, domain, *__ = params
+        timeout = params.timeout
         for partner in self:
             res = requests.delete(
                 urljoin(api_url, "/v3/%s/bounces/%s" % (domain, partner.email)),
@@ -201,3 +194,139 @@ class ResPartner(models.Model):
             )
             if res.status_code in (200, 404) and partner.email_bounced:
                 partner.email_bounced = False
+
+    def _mailgun_bulk_request(self, action, params):
+        """HTTP request checking the partner for a bulk action
+
+        :return: (method, url, keyword arguments)
+        """
+        self.ensure_one()
+        if action == "validity":
+            return (
+                "get",
+                urljoin(params.api_url, "/v3/address/validate"),
+                {
+                    "auth": ("api", params.validation_key),
+                    "params": {"address": self.email, "mailbox_verification": True},
+                },
+            )
+        auth = {"auth": ("api", params.api_key)}
+        bounces_url = urljoin(params.api_url, "/v3/%s/bounces" % params.domain)
+        if action == "set_bounced":
+            return "post", bounces_url, dict(auth, data={"address": self.email})
+        method = "delete" if action == "unset_bounced" else "get"
+        return method, "%s/%s" % (bounces_url, self.email), auth
+
+    def _mailgun_bulk_result(self, action, response):
+        """Interpret the response of a bulk action request
+
+        :return: (new email_bounced value or None to keep it, message to log
+          or None)
+        """
+        self.ensure_one()
+        if response is None:
+            return None, None
+        status = response.status_code
+        if action == "validity":
+            if status != 200:
+                return None, None
+            content = response.json()
+            if not content.get("is_valid"):
+                return True, _(
+                    "%s is not a valid email address. Please check it"
+                    " in order to avoid sending issues"
+                ) % (self.email)
+            if content.get("mailbox_verification") == "false":
+                return True, _(
+                    "%s failed the mailbox verification. Please check it"
+                    " in order to avoid sending issues"
+                ) % (self.email)
+            return None, None
+        if action == "set_bounced":
+            return (True if status == 200 else None), None
+        if action == "unset_bounced":
+            return (False if status in (200, 404) else None), None
+        return {200: True, 404: False}.get(status), None
+
+    def _mailgun_bulk_check(self, action="bounced"):
+        """Run a Mailgun check or action on many partners at once.
+
+        Requests are sent concurrently over a shared keep-alive session,
+        within the Mailgun rate limit, and the results are written back with
+        one write per resulting value.
+
+        :param action: "validity", "bounced", "set_bounced" or "unset_bounced"
+        """
+        partners = self.filtered("email")
+        if not partners:
+            return
+        params = self.env["mail.tracking.email"]._mailgun_values()
+        if action == "validity" and not params.validation_key:
+            raise UserError(
+                _(
+                    "You need to configure mailgun.validation_key"
+                    " in order to be able to check mails validity"
+                )
+            )
+        icp = self.env["ir.config_parameter"].sudo()
+        timeout = params.timeout
+        workers = int(icp.get_param("mailgun.bulk_workers", MAILGUN_BULK_WORKERS))
+        rate = float(icp.get_param("mailgun.rate_limit", MAILGUN_RATE_LIMIT))
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=1, pool_maxsize=workers
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        try:
+            responses = requests_concurrent(
+                session,
+                [partner._mailgun_bulk_request(action, params) for partner in partners],
+                workers,
+                TokenBucket(rate),
+                timeout,
+            )
+        finally:
+            session.close()
+        to_write = {True: self.browse(), False: self.browse()}
+        bodies = {}
+        for partner, response in zip(partners, responses):
+            bounced, body = partner._mailgun_bulk_result(action, response)
+            if bounced is not None and bounced != partner.email_bounced:
+                to_write[bounced] |= partner
+            if body:
+                bodies[partner.id] = body
+        for bounced, records in to_write.items():
+            if records:
+                records.write({"email_bounced": bounced})
+        if bodies:
+            self.browse(list(bodies))._message_log_batch(bodies=bodies)
+
+    @api.model
+    def _cron_mailgun_bulk_check(self, batch_size=MAILGUN_BULK_BATCH_SIZE):
+        """Check the partners of the mailgun.bulk_check_domain system parameter
+        by batches, committing the last checked partner as checkpoint so an
+        interrupted run resumes from there. Once all of them are checked, the
+        next run starts over.
+        """
+        icp = self.env["ir.config_parameter"].sudo()
+        action = icp.get_param("mailgun.bulk_check_action", "bounced")
+        domain = safe_eval(
+            icp.get_param("mailgun.bulk_check_domain", "[('email', '!=', False)]")
+        )
+        testing = getattr(threading.current_thread(), "testing", False)
+        checkpoint_obj = self.env["mail.tracking.checkpoint"].sudo()
+        last_id = int(checkpoint_obj._checkpoint_get(MAILGUN_BULK_CHECKPOINT, 0))
+        while True:
+            partners = self.search(
+                domain + [("id", ">", last_id)], order="id", limit=batch_size
+            )
+            if not partners:
+                break
+            _logger.info("Mailgun %s check of %d partners", action, len(partners))
+            partners._mailgun_bulk_check(action)
+            last_id = partners[-1].id
+            checkpoint_obj._checkpoint_set(MAILGUN_BULK_CHECKPOINT, last_id)
+            if not testing:
+                self.env.cr.commit()  # pylint: disable=invalid-commit
+        checkpoint_obj._checkpoint_set(MAILGUN_BULK_CHECKPOINT, 0)
@@ -3,8 +3,12 @@
 # Copyright 2021 Tecnativa - Jairo Llopis
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 
+import json
+import threading
 from contextlib import contextmanager, suppress
-from unittest.mock import patch
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest.mock import MagicMock, patch
+from urllib.parse import parse_qs, urlparse
 
 from freezegun import freeze_time
 from werkzeug.exceptions import NotAcceptable
@@ -25,6 +29,38 @@ except ImportError:
 _packagepath = "odoo.addons.mail_tracking_mailgun"
 
 
+class FakeMailgunEventsHandler(BaseHTTPRequestHandler):
+    """Serve the pages of events of the server, the page number being given
+    by the ``page`` query parameter of the paging URLs.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        self.server.queries.append(query)
+        page = int(query.get("page", ["0"])[0])
+        pages = self.server.pages
+        host, port = self.server.server_address
+        data = json.dumps(
+            {
+                "items": pages[page] if page < len(pages) else [],
+                "paging": {
+                    "next": "http://%s:%d%s?page=%d"
+                    % (host, port, urlparse(self.path).path, page + 1)
+                },
+            }
+        ).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
 @freeze_time("2016-08-12 17:00:00", tick=True)
 class TestMailgun(TransactionCase):
     def mail_send(self):
@@ -137,6 +173,14 @@ class TestMailgun(TransactionCase):
         with self.assertRaises(ValidationError):
             self.env["mail.tracking.email"]._mailgun_values()
 
+    def test_mailgun_values_cache(self):
+        tracking_model = self.env["mail.tracking.email"]
+        self.assertEqual(tracking_model._mailgun_values().timeout, 10)
+        with self.assertQueryCount(0):
+            tracking_model._mailgun_values()
+        self.env["ir.config_parameter"].set_param("mailgun.timeout", "3")
+        self.assertEqual(tracking_model._mailgun_values().timeout, 3)
+
     def test_no_domain(self):
         self.env["ir.config_parameter"].set_param("mail.catchall.domain", "")
         with self.assertRaises(ValidationError):
@@ -146,11 +190,93 @@ class TestMailgun(TransactionCase):
         self.env["ir.config_parameter"].set_param("mailgun.domain", "eu.example.com")
         self.test_event_delivered()
 
+    @mute_logger("odoo.addons.mail_tracking_mailgun.models.mail_tracking_email")
+    def test_replay(self):
+        for store in ("memory", "database"):
+            self.env["ir.config_parameter"].set_param("mailgun.replay_store", store)
+            with self._request_mock():
+                self.MailTrackingController.mail_tracking_mailgun_webhook()
+            with self._request_mock(reset_replay_cache=False), self.assertRaises(
+                NotAcceptable
+            ):
+                self.MailTrackingController.mail_tracking_mailgun_webhook()
+        token = self.env["mail.tracking.mailgun.token"].search(
+            [("token", "=", self.token)]
+        )
+        self.assertEqual(token.expire, int(self.timestamp) + 600)
+
     @mute_logger("odoo.addons.mail_tracking_mailgun.models.mail_tracking_email")
     def test_bad_signature(self):
+        signature = self.signature
         self.signature = "bad_signature"
-        with self._request_mock(), self.assertRaises(NotAcceptable):
+        token_model = self.env["mail.tracking.mailgun.token"]
+        for store in ("memory", "database"):
+            self.env["ir.config_parameter"].set_param("mailgun.replay_store", store)
+            with self._request_mock(), self.assertRaises(NotAcceptable):
+                self.MailTrackingController.mail_tracking_mailgun_webhook()
+            # Forged requests don't consume a slot of the replay store
+            self.assertFalse(token_model._memory_tokens().get(self.token))
+            self.assertFalse(token_model.search([("token", "=", self.token)]))
+        # So the genuine request is still accepted
+        self.signature = signature
+        with self._request_mock(reset_replay_cache=False):
             self.MailTrackingController.mail_tracking_mailgun_webhook()
+        self.assertTrue(token_model.search([("token", "=", self.token)]))
+
+    @mute_logger(
+        "odoo.addons.mail_tracking_mailgun.controllers.main",
+        "odoo.addons.mail_tracking_mailgun.models.mail_tracking_email",
+    )
+    def test_webhook_batch(self):
+        signature = {
+            "timestamp": self.timestamp,
+            "token": self.token,
+            "signature": self.signature,
+        }
+        bad_event = dict(self.event, id="bad-signature")
+        other_db_event = dict(
+            self.event,
+            id="other-db",
+            **{"user-variables": {"odoo_db": "other", "tracking_email_id": 1}},
+        )
+        with self._request_mock() as request:
+            request.dispatcher.jsonrequest = {
+                "events": [
+                    {"signature": signature, "event-data": self.event},
+                    {
+                        "signature": dict(signature, signature="bad"),
+                        "event-data": bad_event,
+                    },
+                    {"signature": signature, "event-data": other_db_event},
+                    {"event-data": dict(self.event, id="no-signature")},
+                    "garbage",
+                    {"signature": signature, "event-data": self.event},
+                ]
+            }
+            result = self.MailTrackingController.mail_tracking_mailgun_webhook_batch()
+        self.assertEqual(
+            result,
+            [
+                {"id": self.event["id"], "status": "created"},
+                {"id": "bad-signature", "status": "rejected"},
+                {"id": "other-db", "status": "skipped"},
+                {"id": "no-signature", "status": "rejected"},
+                {"id": None, "status": "rejected"},
+                {"id": self.event["id"], "status": "created"},
+            ],
+        )
+        self.assertEqual(len(self.event_search("delivered")), 1)
+        # Already imported events are skipped
+        with self._request_mock() as request:
+            request.dispatcher.jsonrequest = {
+                "events": [{"signature": signature, "event-data": self.event}]
+            }
+            result = self.MailTrackingController.mail_tracking_mailgun_webhook_batch()
+        self.assertEqual(result, [{"id": self.event["id"], "status": "skipped"}])
+        # The route is refused without a signing key
+        self.env["ir.config_parameter"].set_param("mailgun.webhook_signing_key", "")
+        with self._request_mock(), self.assertRaises(NotAcceptable):
+            self.MailTrackingController.mail_tracking_mailgun_webhook_batch()
 
     @mute_logger("odoo.addons.mail_tracking_mailgun.models.mail_tracking_email")
     def test_bad_event_type(self):
@@ -216,6 +342,19 @@ class TestMailgun(TransactionCase):
             self.assertEqual(event.timestamp, float(self.timestamp))
             self.assertEqual(event.recipient, self.recipient)
 
+    def test_event_delivered_queued(self):
+        self.env["ir.config_parameter"].set_param("mailgun.webhook_queue", "True")
+        queue_obj = self.env["mail.tracking.event.queue"]
+        self.event.update({"event": "delivered"})
+        with self._request_mock():
+            self.MailTrackingController.mail_tracking_mailgun_webhook()
+        self.assertFalse(self.tracking_email.tracking_event_ids)
+        self.assertEqual(queue_obj.search([]).source, "mailgun")
+        queue_obj._cron_process()
+        self.assertFalse(queue_obj.search([]))
+        event = self.event_search("delivered")
+        self.assertEqual(event.mailgun_id, self.event["id"])
+
     # https://documentation.mailgun.com/en/latest/user_manual.html#tracking-opens
     def test_event_opened(self):
         ip = "127.0.0.1"
@@ -437,6 +576,42 @@ class TestMailgun(TransactionCase):
         self.partner.force_unset_bounced()
         self.assertFalse(self.partner.email_bounced)
 
+    @patch(f"{_packagepath}.models.res_partner.requests")
+    def test_bulk_check(self, mock_request):
+        partners = self.env["res.partner"].create(
+            [
+                {"name": "Bulk %d" % i, "email": "bulk-%d@example.com" % i}
+                for i in range(3)
+            ]
+        )
+        partners[2].email_bounced = True
+
+        def request(method, url, **kwargs):
+            response = MagicMock()
+            response.status_code = 200 if url.endswith("/bulk-0@example.com") else 404
+            return response
+
+        session = mock_request.Session.return_value
+        session.request.side_effect = request
+        partners._mailgun_bulk_check("bounced")
+        self.assertEqual(session.request.call_count, 3)
+        self.assertEqual(partners.mapped("email_bounced"), [True, False, False])
+        # The cron checks the partners of the domain by batches
+        icp = self.env["ir.config_parameter"]
+        icp.set_param("mailgun.bulk_check_domain", "[('id', 'in', %s)]" % partners.ids)
+        icp.set_param("mailgun.bulk_check_action", "set_bounced")
+        session.request.side_effect = None
+        session.request.return_value.status_code = 200
+        self.env["res.partner"]._cron_mailgun_bulk_check(batch_size=2)
+        self.assertEqual(session.request.call_count, 6)
+        self.assertEqual(partners.mapped("email_bounced"), [True, True, True])
+        self.assertEqual(
+            self.env["mail.tracking.checkpoint"]._checkpoint_get(
+                "mailgun.bulk_check_last_partner_id"
+            ),
+            "0",
+        )
+
     def test_email_bounced_set(self):
         message_number = len(self.partner.message_ids) + 1
         self.partner._email_bounced_set("test_error", False)
@@ -456,6 +631,48 @@ class TestMailgun(TransactionCase):
         self.assertTrue(event)
         self.assertEqual(event.event_type, self.response["items"][0]["event"])
 
+    def _fake_mailgun_server(self, pages):
+        server = HTTPServer(("127.0.0.1", 0), FakeMailgunEventsHandler)
+        server.pages = pages
+        server.queries = []
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.env["ir.config_parameter"].set_param(
+            "mailgun.api_url", "http://127.0.0.1:%d" % server.server_address[1]
+        )
+        return server
+
+    def test_events_sync(self):
+        other_db_event = dict(
+            self.event, id="other-db", **{"user-variables": {"odoo_db": "other"}}
+        )
+        opened_event = dict(self.event, id="opened-id", event="opened")
+        server = self._fake_mailgun_server(
+            [[self.event, other_db_event], [opened_event]]
+        )
+        checkpoint_obj = self.env["mail.tracking.checkpoint"]
+        checkpoint_obj._checkpoint_set("mailgun.events_checkpoint", 1471000000)
+        tracking_model = self.env["mail.tracking.email"]
+        tracking_model._cron_mailgun_events_sync()
+        # The two pages and the empty one ending the pagination
+        self.assertEqual(len(server.queries), 3)
+        self.assertEqual(server.queries[0]["begin"], ["1471000000.0"])
+        self.assertEqual(
+            set(self.tracking_email.tracking_event_ids.mapped("mailgun_id")),
+            {"opened-id", self.event["id"]},
+        )
+        self.assertFalse(
+            self.env["mail.tracking.event"].search([("mailgun_id", "=", "other-db")])
+        )
+        checkpoint = float(checkpoint_obj._checkpoint_get("mailgun.events_checkpoint"))
+        self.assertGreater(checkpoint, 1471000000)
+        # Already imported events are skipped
+        checkpoint_obj._checkpoint_set("mailgun.events_checkpoint", 1471000000)
+        tracking_model._cron_mailgun_events_sync()
+        self.assertEqual(len(self.tracking_email.tracking_event_ids), 2)
+
     @patch(f"{_packagepath}.models.mail_tracking_email.requests")
     def test_manual_check_exceptions(self, mock_request):
         mock_request.get.return_value.status_code = 404
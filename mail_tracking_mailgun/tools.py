@@ -0,0 +1,63 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+_logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Thread-safe token bucket limiting the rate of the API calls to ``rate``
+    per second, with bursts of up to ``capacity`` calls.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Wait until a call is allowed"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def requests_concurrent(session, requests_args, workers, bucket, timeout):
+    """Send HTTP requests from a pool of threads sharing the same session.
+
+    The threads only perform the HTTP calls, they must not use the ORM.
+
+    :param requests_args: list of (method, url, keyword arguments)
+    :return: list of the responses, in the same order, with None for the
+      requests that couldn't be sent
+    """
+
+    def send(args):
+        method, url, kwargs = args
+        bucket.acquire()
+        try:
+            return session.request(method, url, timeout=timeout, **kwargs)
+        except requests.RequestException as error:
+            _logger.warning("Mailgun request %s %s failed: %s", method, url, error)
+            return None
+
+    if not requests_args:
+        return []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(send, requests_args))
@@ -79,9 +79,7 @@ class ResConfigSettings(models.TransientModel):
         webhooks = requests.get(
             urljoin(params.api_url, "/v3/domains/%s/webhooks" % params.domain),
             auth=("api", params.api_key),
-            timeout=self.env["ir.config_parameter"]
-            .sudo()
-            .get_param("mailgun.timeout", MAILGUN_TIMEOUT),
+            timeout=params.timeout,
         )
         webhooks.raise_for_status()
         for event, data in webhooks.json()["webhooks"].items():
@@ -100,9 +98,7 @@ class ResConfigSettings(models.TransientModel):
                     "/v3/domains/%s/webhooks/%s" % (params.domain, event),
                 ),
                 auth=("api", params.api_key),
-                timeout=self.env["ir.config_parameter"]
-                .sudo()
-                .get_param("mailgun.timeout", MAILGUN_TIMEOUT),
+                timeout=params.timeout,
             )
             response.raise_for_status()
 
@@ -119,9 +115,7 @@ class ResConfigSettings(models.TransientModel):
                 urljoin(params.api_url, "/v3/domains/%s/webhooks" % params.domain),
                 auth=("api", params.api_key),
                 data={"id": event, "url": [odoo_webhook]},
-                timeout=self.env["ir.config_parameter"]
-                .sudo()
-                .get_param("mailgun.timeout", MAILGUN_TIMEOUT),
+                timeout=params.timeout,
             )
             # Assert correct registration
             response.raise_for_status()
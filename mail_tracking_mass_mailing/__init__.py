@@ -3,4 +3,4 @@
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
 
 from . import models
-from .hooks import pre_init_hook
+from .hooks import pre_init_hook, post_init_hook
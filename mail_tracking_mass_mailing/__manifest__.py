@@ -7,7 +7,7 @@
 {
     "name": "Mail tracking for mass mailing",
     "summary": "Improve mass mailing email tracking",
-    "version": "16.0.1.0.0",
+    "version": "16.0.1.2.0",
     "category": "Social Network",
     "website": "https://github.com/OCA/social",
     "author": "Tecnativa, Odoo Community Association (OCA)",
@@ -17,10 +17,22 @@
     "auto_install": True,
     "depends": ["mass_mailing", "mail_tracking"],
     "data": [
+        "security/ir.model.access.csv",
         "views/mail_tracking_email_view.xml",
         "views/mail_trace_view.xml",
         "views/mail_mass_mailing_view.xml",
         "views/mailing_contact_view.xml",
+        "views/mail_tracking_stats_daily_view.xml",
+        "views/mailing_tracking_funnel_view.xml",
     ],
+    "assets": {
+        "web.assets_backend": [
+            "mail_tracking_mass_mailing/static/src/components/"
+            "mailing_tracking_funnel/mailing_tracking_funnel.esm.js",
+            "mail_tracking_mass_mailing/static/src/components/"
+            "mailing_tracking_funnel/mailing_tracking_funnel.xml",
+        ],
+    },
     "pre_init_hook": "pre_init_hook",
+    "post_init_hook": "post_init_hook",
 }
@@ -4,6 +4,8 @@
 
 import logging
 
+from odoo import SUPERUSER_ID, api
+
 try:
     from odoo.addons.mail_tracking.hooks import column_add_with_value
 except ImportError:
@@ -18,3 +20,9 @@ def pre_init_hook(cr):
         column_add_with_value(
             cr, "mailing_contact", "email_score", "double precision", 50.0
         )
+
+
+def post_init_hook(cr, registry):
+    """Fill the funnels of the mailings with the already existing events"""
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    env["mailing.tracking.funnel"]._rebuild()
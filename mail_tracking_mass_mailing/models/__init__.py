@@ -7,3 +7,6 @@ from . import mail_tracking_email
 from . import mail_tracking_event
 from . import mailing_trace
 from . import mailing_contact
+from . import mail_tracking_stats_daily
+from . import mailing_tracking_funnel
+from . import ir_websocket
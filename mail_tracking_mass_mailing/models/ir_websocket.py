@@ -0,0 +1,20 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+from odoo import models
+
+
+class IrWebsocket(models.AbstractModel):
+    _inherit = "ir.websocket"
+
+    def _build_bus_channel_list(self, channels):
+        """Only let mass mailing users listen to the tracking funnels"""
+        if not self.env.user.has_group("mass_mailing.group_mass_mailing_user"):
+            channels = [
+                channel
+                for channel in channels
+                if not (
+                    isinstance(channel, str)
+                    and channel.startswith("mail_tracking_mass_mailing.funnel_")
+                )
+            ]
+        return super()._build_bus_channel_list(channels)
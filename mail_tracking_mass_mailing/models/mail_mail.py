@@ -2,6 +2,8 @@
 # Copyright 2017 Tecnativa - Vicent Cubells
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
 
+from collections import defaultdict
+
 from odoo import api, models
 
 
@@ -40,21 +42,25 @@ class MailMail(models.Model):
         the mass_mailing module set a 'sent' status if we had an exception, hence
         the usage of a context key to ignore possible writes.
         """
-        processed_ids = []
-        for mail in self:
-            mail_tracking = mail.mailing_trace_ids.mail_tracking_id
-            if mail.mailing_id and mail_tracking.state == "error":
-                mail_failure_type = (
+        trace_ids_by_failure = defaultdict(list)
+        for mail in self.filtered("mailing_id"):
+            for trace in mail.mailing_trace_ids:
+                mail_tracking = trace.mail_tracking_id
+                if mail_tracking.state != "error":
+                    continue
+                trace_ids_by_failure[
                     "mail_email_invalid"
                     if mail_tracking.error_type == "no_recipient"
                     else "mail_smtp"
-                )
-                mail.mailing_trace_ids.write(
-                    {
-                        "failure_type": mail_failure_type,
-                    }
-                )
-                processed_ids.extend(mail.mailing_trace_ids.ids)
+                ].append(trace.id)
+        traces_model = self.env["mailing.trace"]
+        for mail_failure_type, trace_ids in trace_ids_by_failure.items():
+            traces_model.browse(trace_ids).write({"failure_type": mail_failure_type})
+        processed_ids = frozenset(
+            trace_id
+            for trace_ids in trace_ids_by_failure.values()
+            for trace_id in trace_ids
+        )
         return super(
             MailMail,
             self.with_context(_ignore_write_trace_postprocess_ids=processed_ids),
@@ -2,6 +2,8 @@
 # Copyright 2017 Tecnativa - Vicent Cubells
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
 
+from collections import defaultdict
+
 from odoo import api, fields, models
 
 
@@ -9,10 +11,16 @@ class MailTrackingEmail(models.Model):
     _inherit = "mail.tracking.email"
 
     mass_mailing_id = fields.Many2one(
-        string="Mass mailing", comodel_name="mailing.mailing", readonly=True
+        string="Mass mailing",
+        comodel_name="mailing.mailing",
+        readonly=True,
+        index="btree_not_null",
     )
     mail_stats_id = fields.Many2one(
-        string="Mail statistics", comodel_name="mailing.trace", readonly=True
+        string="Mail statistics",
+        comodel_name="mailing.trace",
+        readonly=True,
+        index="btree_not_null",
     )
     mail_id_int = fields.Integer(string="Mail ID", readonly=True)
 
@@ -29,32 +37,88 @@ class MailTrackingEmail(models.Model):
             tracking.message_id = tracking.mail_stats_id.message_id
         return res
 
+    def _statistics_link(self):
+        """Link each tracking to its mailing.trace.
+
+        The trace of every tracking is linked with a single UPDATE, only the
+        values added by ``_statistics_link_prepare`` inherits are written
+        through the ORM, grouped by distinct values.
+        """
+        links = []
+        traces_by_vals = defaultdict(list)
+        for tracking in self.filtered("mail_stats_id"):
+            vals = dict(self._statistics_link_prepare(tracking))
+            links.append((tracking.mail_stats_id.id, vals.pop("mail_tracking_id")))
+            if vals:
+                traces_by_vals[tuple(sorted(vals.items()))].append(
+                    tracking.mail_stats_id.id
+                )
+        if not links:
+            return
+        traces_model = self.env["mailing.trace"]
+        traces_model.flush_model(["mail_tracking_id"])
+        self.env.cr.execute(
+            """
+            UPDATE mailing_trace trace
+            SET mail_tracking_id = link.mail_tracking_id,
+                write_uid = %s,
+                write_date = NOW() AT TIME ZONE 'UTC'
+            FROM (VALUES %s) AS link(id, mail_tracking_id)
+            WHERE trace.id = link.id
+            """
+            % (int(self.env.uid), ", ".join(["(%s, %s)"] * len(links))),
+            [value for link in links for value in link],
+        )
+        traces_model.invalidate_model(
+            ["mail_tracking_id", "tracking_event_ids", "write_uid", "write_date"]
+        )
+        for vals, trace_ids in traces_by_vals.items():
+            traces_model.browse(trace_ids).write(dict(vals))
+
     @api.model_create_multi
     def create(self, vals_list):
-        tracking = super().create(vals_list)
-        # Link mail statistics with this tracking
-        if tracking.mail_stats_id:
-            tracking.mail_stats_id.write(self._statistics_link_prepare(tracking))
-        return tracking
+        trackings = super().create(vals_list)
+        # Link mail statistics with these trackings
+        trackings._statistics_link()
+        return trackings
+
+    @api.model
+    def _trace_status_flush(self, statuses):
+        """Apply mailing traces statuses, with one write per status
+
+        :param statuses: dictionary {mailing.trace id: "open" or "bounce"}
+        """
+        trace_ids_by_status = defaultdict(list)
+        for trace_id, status in statuses.items():
+            trace_ids_by_status[status].append(trace_id)
+        traces_model = self.env["mailing.trace"].sudo()
+        if trace_ids_by_status["open"]:
+            traces_model.browse(trace_ids_by_status["open"]).set_opened()
+        if trace_ids_by_status["bounce"]:
+            traces_model.browse(trace_ids_by_status["bounce"]).set_bounced()
+
+    @api.model
+    def _event_batch_flush(self, batch):
+        res = super()._event_batch_flush(batch)
+        if batch.get("traces"):
+            self._trace_status_flush(batch["traces"])
+        return res
 
     def _contacts_email_bounced_set(self, reason, event=None):
-        recipients = []
-        if event and event.recipient_address:
-            recipients.append(event.recipient_address)
-        else:
-            recipients = list(filter(None, self.mapped("recipient_address")))
-        for recipient in recipients:
-            self.env["mailing.contact"].search(
-                [("email", "=ilike", recipient)]
-            ).email_bounced_set(self, reason, event=event)
+        self.env["mailing.contact"]._email_bounced_propagate(
+            [
+                (address, self, reason, event)
+                for address in self._bounced_addresses(event)
+            ]
+        )
 
     def smtp_error(self, mail_server, smtp_server, exception):
         res = super().smtp_error(mail_server, smtp_server, exception)
         self._contacts_email_bounced_set("error")
         return res
 
-    def event_create(self, event_type, metadata):
-        res = super().event_create(event_type, metadata)
-        if event_type in {"hard_bounce", "spam", "reject"}:
-            self._contacts_email_bounced_set(event_type)
+    @api.model
+    def _events_email_bounced_set(self, bounces):
+        res = super()._events_email_bounced_set(bounces)
+        self.env["mailing.contact"].sudo()._email_bounced_propagate(bounces)
         return res
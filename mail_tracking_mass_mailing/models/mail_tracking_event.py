@@ -16,18 +16,35 @@ class MailTrackingEvent(models.Model):
         store=True,
     )
 
+    @api.model_create_multi
+    def create(self, vals_list):
+        events = super().create(vals_list)
+        self.env["mailing.tracking.funnel"].sudo()._funnel_events_add(events)
+        return events
+
+    def _trace_status_set(self, tracking_email, status):
+        """Set the status of the mailing trace of the tracking email, or delay
+        it until the end of the batch when processing several events at once.
+
+        :param status: "open" or "bounce"
+        """
+        trace = tracking_email.mail_stats_id
+        if not trace:
+            return
+        batch = self.env.context.get("mail_tracking_event_batch")
+        if batch is None:
+            self.env["mail.tracking.email"]._trace_status_flush({trace.id: status})
+        else:
+            batch.setdefault("traces", {})[trace.id] = status
+
     @api.model
     def process_open(self, tracking_email, metadata):
         res = super().process_open(tracking_email, metadata)
-        mail_mail_stats = self.sudo().env["mailing.trace"]
-        domain = [("mail_mail_id_int", "=", tracking_email.mail_id_int)]
-        mail_mail_stats.set_opened(domain=domain)
+        self._trace_status_set(tracking_email, "open")
         return res
 
     def _tracking_set_bounce(self, tracking_email, metadata):
-        mail_mail_stats = self.sudo().env["mailing.trace"]
-        domain = [("mail_mail_id_int", "=", tracking_email.mail_id_int)]
-        mail_mail_stats.set_bounced(domain=domain)
+        self._trace_status_set(tracking_email, "bounce")
 
     @api.model
     def process_hard_bounce(self, tracking_email, metadata):
@@ -0,0 +1,17 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+from odoo import api, fields, models
+
+
+class MailTrackingStatsDaily(models.Model):
+    _inherit = "mail.tracking.stats.daily"
+
+    mass_mailing_id = fields.Many2one(
+        string="Mass mailing", comodel_name="mailing.mailing", readonly=True
+    )
+
+    @api.model
+    def _stats_dimensions(self):
+        res = super()._stats_dimensions()
+        res["mass_mailing_id"] = "tracking.mass_mailing_id"
+        return res
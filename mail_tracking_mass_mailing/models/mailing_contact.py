@@ -13,12 +13,18 @@ class MailMassMailingContact(models.Model):
         string="Email score", readonly=True, store=False, compute="_compute_email_score"
     )
 
-    @api.depends("email")
+    @api.depends("email", "email_normalized")
     def _compute_email_score(self):
         with_email = self.filtered("email")
+        mt_obj = self.env["mail.tracking.email"]
+        stats = (
+            self.env["mail.tracking.address.stats"]
+            .sudo()
+            ._stats_get(with_email.mapped("email_normalized"))
+        )
         for contact in with_email:
-            contact.email_score = self.env[
-                "mail.tracking.email"
-            ].email_score_from_email(contact.email)
+            contact.email_score = mt_obj._email_score_from_states(
+                stats.get(contact.email_normalized, {})
+            )
         remaining = self - with_email
         remaining.email_score = 0.0
@@ -9,7 +9,10 @@ class MailTrace(models.Model):
     _inherit = "mailing.trace"
 
     mail_tracking_id = fields.Many2one(
-        string="Mail tracking", comodel_name="mail.tracking.email", readonly=True
+        string="Mail tracking",
+        comodel_name="mail.tracking.email",
+        readonly=True,
+        index="btree_not_null",
     )
     tracking_event_ids = fields.One2many(
         string="Tracking events",
@@ -22,5 +25,7 @@ class MailTrace(models.Model):
         """Ignore write from _postprocess_sent_message on selected ids"""
         to_ignore_ids = self.env.context.get("_ignore_write_trace_postprocess_ids")
         if to_ignore_ids:
-            self = self.browse(set(self.ids) - set(to_ignore_ids))
+            # No copy when it is already a frozenset
+            to_ignore_ids = frozenset(to_ignore_ids)
+            self = self.browse([x for x in self._ids if x not in to_ignore_ids])
         return super().write(values)
@@ -0,0 +1,209 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+import logging
+from collections import defaultdict
+
+from odoo import api, fields, models
+
+_logger = logging.getLogger(__name__)
+
+# Funnel column counting the trackings that received each event type
+FUNNEL_EVENT_COLUMNS = {
+    "sent": "sent",
+    "delivered": "delivered",
+    "open": "opened",
+    "click": "clicked",
+    "hard_bounce": "bounced",
+    "soft_bounce": "bounced",
+    "reject": "bounced",
+    "spam": "spam",
+    "unsub": "unsub",
+}
+FUNNEL_COLUMNS = ["sent", "delivered", "opened", "clicked", "bounced", "spam", "unsub"]
+FUNNEL_NOTIFICATION = "mail_tracking_mass_mailing/funnel"
+# Transaction data key of the events waiting to be added to the funnels
+FUNNEL_PENDING_EVENTS = "mailing.tracking.funnel.event_ids"
+
+
+class MailingTrackingFunnel(models.Model):
+    """Delivery funnel of each mass mailing.
+
+    Every column counts the trackings of the mailing that received at least
+    one event of the matching types. The events created in a transaction are
+    added to the counters once, right before its commit, and the new values
+    are pushed to the mailing forms open in the web client.
+    """
+
+    _name = "mailing.tracking.funnel"
+    _description = "Mass mailing tracking funnel"
+    _order = "mass_mailing_id desc"
+    _rec_name = "mass_mailing_id"
+    _log_access = False
+
+    mass_mailing_id = fields.Many2one(
+        string="Mass mailing",
+        comodel_name="mailing.mailing",
+        readonly=True,
+        required=True,
+        ondelete="cascade",
+    )
+    sent = fields.Integer(readonly=True)
+    delivered = fields.Integer(readonly=True)
+    opened = fields.Integer(readonly=True)
+    clicked = fields.Integer(readonly=True)
+    bounced = fields.Integer(readonly=True)
+    spam = fields.Integer(readonly=True)
+    unsub = fields.Integer(string="Unsubscribed", readonly=True)
+
+    _sql_constraints = [
+        (
+            "mass_mailing_uniq",
+            "UNIQUE(mass_mailing_id)",
+            "There is already a funnel for this mass mailing.",
+        )
+    ]
+
+    @api.model
+    def _funnel_channel(self, mass_mailing_id):
+        """Bus channel the funnel of a mailing is pushed to"""
+        return "mail_tracking_mass_mailing.funnel_%d" % mass_mailing_id
+
+    @api.model
+    def _funnel_events_add(self, events):
+        """Add the events to the funnels before the commit of the transaction
+
+        :param events: just created mail.tracking.event records
+        """
+        events = events.filtered(
+            lambda x: x.mass_mailing_id and x.event_type in FUNNEL_EVENT_COLUMNS
+        )
+        if not events:
+            return
+        pending = self.env.cr.precommit.data.setdefault(FUNNEL_PENDING_EVENTS, set())
+        if not pending:
+            self.env.cr.precommit.add(self._funnel_events_flush)
+        pending.update(events.ids)
+
+    @api.model
+    def _funnel_events_flush(self):
+        """Add the events created in the transaction to the funnels"""
+        event_ids = self.env.cr.precommit.data.pop(FUNNEL_PENDING_EVENTS, set())
+        events = self.env["mail.tracking.event"].browse(sorted(event_ids)).exists()
+        self._funnel_update(self._funnel_new_events(events))
+
+    @api.model
+    def _funnel_new_events(self, events):
+        """Count the events that are the first of their funnel column for their
+        tracking.
+
+        :param events: mail.tracking.event records created in the transaction
+        :return: dictionary {mass_mailing_id: {column: count}}
+        """
+        events = events.filtered(
+            lambda x: x.mass_mailing_id and x.event_type in FUNNEL_EVENT_COLUMNS
+        )
+        deltas = defaultdict(lambda: defaultdict(int))
+        if not events:
+            return deltas
+        events.flush_model(["tracking_email_id", "event_type"])
+        columns = {FUNNEL_EVENT_COLUMNS[x] for x in events.mapped("event_type")}
+        self.env.cr.execute(
+            """
+            SELECT DISTINCT tracking_email_id, event_type
+            FROM mail_tracking_event
+            WHERE tracking_email_id IN %s AND event_type IN %s AND id NOT IN %s
+            """,
+            (
+                tuple(set(events.tracking_email_id.ids)),
+                tuple(x for x, y in FUNNEL_EVENT_COLUMNS.items() if y in columns),
+                tuple(events.ids),
+            ),
+        )
+        seen = {
+            (tracking_email_id, FUNNEL_EVENT_COLUMNS[event_type])
+            for tracking_email_id, event_type in self.env.cr.fetchall()
+        }
+        for event in events:
+            key = (event.tracking_email_id.id, FUNNEL_EVENT_COLUMNS[event.event_type])
+            if key in seen:
+                continue
+            seen.add(key)
+            deltas[event.mass_mailing_id.id][key[1]] += 1
+        return deltas
+
+    @api.model
+    def _funnel_update(self, deltas):
+        """Add the deltas to the counters and push the new values to the bus
+
+        :param deltas: dictionary {mass_mailing_id: {column: count}}
+        """
+        if not deltas:
+            return
+        mass_mailing_ids = list(deltas)
+        self.env.cr.execute(
+            """
+            INSERT INTO mailing_tracking_funnel (mass_mailing_id, {columns})
+            SELECT * FROM unnest(%s::integer[], {arrays})
+            ON CONFLICT (mass_mailing_id) DO UPDATE SET {updates}
+            RETURNING mass_mailing_id, {columns}
+            """.format(
+                columns=", ".join(FUNNEL_COLUMNS),
+                arrays=", ".join(["%s::integer[]"] * len(FUNNEL_COLUMNS)),
+                updates=", ".join(
+                    "{0} = mailing_tracking_funnel.{0} + EXCLUDED.{0}".format(column)
+                    for column in FUNNEL_COLUMNS
+                ),
+            ),
+            [mass_mailing_ids]
+            + [
+                [deltas[mass_mailing_id].get(column, 0) for mass_mailing_id in deltas]
+                for column in FUNNEL_COLUMNS
+            ],
+        )
+        self.invalidate_model()
+        self._funnel_notify(self.env.cr.dictfetchall())
+
+    @api.model
+    def _funnel_notify(self, rows):
+        """Push funnel rows to the mailing forms displaying them"""
+        self.env["bus.bus"]._sendmany(
+            [
+                (
+                    self._funnel_channel(row["mass_mailing_id"]),
+                    FUNNEL_NOTIFICATION,
+                    dict(row),
+                )
+                for row in rows
+            ]
+        )
+
+    @api.model
+    def _rebuild(self):
+        """Recompute all the funnels from the tracking events"""
+        self.env["mail.tracking.event"].flush_model(
+            ["tracking_email_id", "event_type", "mass_mailing_id"]
+        )
+        _logger.info("Rebuilding mass mailing tracking funnels")
+        self.env.cr.execute("DELETE FROM mailing_tracking_funnel")
+        columns = defaultdict(list)
+        for event_type, column in FUNNEL_EVENT_COLUMNS.items():
+            columns[column].append(event_type)
+        self.env.cr.execute(
+            """
+            INSERT INTO mailing_tracking_funnel (mass_mailing_id, {columns})
+            SELECT mass_mailing_id, {counts}
+            FROM mail_tracking_event
+            WHERE mass_mailing_id IS NOT NULL
+            GROUP BY mass_mailing_id
+            """.format(
+                columns=", ".join(FUNNEL_COLUMNS),
+                counts=", ".join(
+                    "COUNT(DISTINCT tracking_email_id) "
+                    "FILTER (WHERE event_type IN %s)"
+                    for __ in FUNNEL_COLUMNS
+                ),
+            ),
+            [tuple(columns[column]) for column in FUNNEL_COLUMNS],
+        )
+        self.invalidate_model()
+        return True
@@ -0,0 +1,101 @@
+/** @odoo-module **/
+
+import {
+    Component,
+    onWillDestroy,
+    onWillStart,
+    onWillUpdateProps,
+    useState,
+} from "@odoo/owl";
+import {registry} from "@web/core/registry";
+import {standardWidgetProps} from "@web/views/widgets/standard_widget_props";
+import {useService} from "@web/core/utils/hooks";
+
+const FUNNEL_NOTIFICATION = "mail_tracking_mass_mailing/funnel";
+
+/**
+ * Delivery funnel of the mass mailing, updated live from the bus
+ */
+export class MailingTrackingFunnel extends Component {
+    setup() {
+        this.orm = useService("orm");
+        this.busService = useService("bus_service");
+        this.state = useState({funnel: {}});
+        this.mailingId = false;
+        this.onNotification = this.onNotification.bind(this);
+        this.busService.addEventListener("notification", this.onNotification);
+        onWillStart(() => this.loadFunnel(this.props.record.resId));
+        // The form view reuses the widget when browsing to another mailing
+        onWillUpdateProps((nextProps) => {
+            if (nextProps.record.resId !== this.mailingId) {
+                return this.loadFunnel(nextProps.record.resId);
+            }
+        });
+        onWillDestroy(() => {
+            this.subscribe(false);
+            this.busService.removeEventListener("notification", this.onNotification);
+        });
+    }
+
+    channel(mailingId) {
+        return `mail_tracking_mass_mailing.funnel_${mailingId}`;
+    }
+
+    // Listen to the funnel of the given mailing instead of the current one
+    subscribe(mailingId) {
+        if (this.mailingId) {
+            this.busService.deleteChannel(this.channel(this.mailingId));
+        }
+        this.mailingId = mailingId;
+        if (mailingId) {
+            this.busService.addChannel(this.channel(mailingId));
+        }
+    }
+
+    async loadFunnel(mailingId) {
+        this.subscribe(mailingId);
+        this.state.funnel = {};
+        if (!mailingId) {
+            return;
+        }
+        const funnels = await this.orm.searchRead(
+            "mailing.tracking.funnel",
+            [["mass_mailing_id", "=", mailingId]],
+            this.columns.map((column) => column.name)
+        );
+        // Ignore the answer if the widget moved to another mailing meanwhile
+        if (mailingId === this.mailingId) {
+            this.state.funnel = funnels[0] || {};
+        }
+    }
+
+    get columns() {
+        return [
+            {name: "sent", string: this.env._t("Sent")},
+            {name: "delivered", string: this.env._t("Delivered")},
+            {name: "opened", string: this.env._t("Opened")},
+            {name: "clicked", string: this.env._t("Clicked")},
+            {name: "bounced", string: this.env._t("Bounced")},
+            {name: "spam", string: this.env._t("Spam")},
+            {name: "unsub", string: this.env._t("Unsubscribed")},
+        ];
+    }
+
+    onNotification({detail: notifications}) {
+        for (const {payload, type} of notifications) {
+            if (
+                type === FUNNEL_NOTIFICATION &&
+                payload.mass_mailing_id === this.mailingId
+            ) {
+                this.state.funnel = payload;
+            }
+        }
+    }
+}
+
+MailingTrackingFunnel.template = "mail_tracking_mass_mailing.MailingTrackingFunnel";
+MailingTrackingFunnel.props = {...standardWidgetProps};
+
+registry
+    .category("view_widgets")
+    .add("mailing_tracking_funnel", MailingTrackingFunnel);
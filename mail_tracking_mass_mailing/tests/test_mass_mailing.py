@@ -122,3 +122,110 @@ class TestMassMailing(TransactionCase):
         self.contact_a.email = "contact_a@example.com"
         self.assertTrue(self.contact_a.email_bounced)
         self.assertTrue(self.contact_a.email_score < 50.0)
+
+    def test_trace_status_batch(self):
+        self.env["mailing.contact"].create(
+            [
+                {
+                    "list_ids": [(6, 0, self.list.ids)],
+                    "name": "Test contact %s" % letter,
+                    "email": "contact_%s@example.com" % letter,
+                }
+                for letter in "bc"
+            ]
+        )
+        self.mailing.action_send_mail()
+        traces = self.mailing.mailing_trace_ids
+        traces.mail_mail_id.send()
+        self.assertEqual(len(traces.mail_tracking_id), 3)
+        trace_a, trace_b, trace_c = traces
+        self.env["mail.tracking.email"].event_create_batch(
+            [
+                (trace_a.mail_tracking_id.id, "open", {}),
+                (trace_b.mail_tracking_id.id, "open", {}),
+                (trace_b.mail_tracking_id.id, "hard_bounce", {}),
+                (trace_c.mail_tracking_id.id, "spam", {}),
+            ]
+        )
+        self.assertEqual(trace_a.trace_status, "open")
+        self.assertEqual(trace_b.trace_status, "bounce")
+        self.assertEqual(trace_c.trace_status, "bounce")
+
+    def test_statistics_link_batch(self):
+        traces = self.env["mailing.trace"].create(
+            [
+                {
+                    "mass_mailing_id": self.mailing.id,
+                    "model": "mailing.contact",
+                    "res_id": self.contact_a.id,
+                    "email": "contact_%s@example.com" % letter,
+                }
+                for letter in "ab"
+            ]
+        )
+        trackings = self.env["mail.tracking.email"].create(
+            [
+                {
+                    "recipient": trace.email,
+                    "mass_mailing_id": self.mailing.id,
+                    "mail_stats_id": trace.id,
+                }
+                for trace in traces
+            ]
+            + [{"recipient": "other@example.com"}]
+        )
+        self.assertEqual(traces.mapped("mail_tracking_id"), trackings[:2])
+        for trace, tracking in zip(traces, trackings):
+            self.assertEqual(trace.mail_tracking_id, tracking)
+
+    def test_tracking_funnel(self):
+        self.mailing.action_send_mail()
+        self.mailing.mailing_trace_ids.mail_mail_id.send()
+        tracking = self.mailing.mailing_trace_ids.mail_tracking_id
+        tracking.event_create_batch(
+            [
+                (tracking.id, "delivered", {}),
+                (tracking.id, "open", {"timestamp": 1000.0}),
+                (tracking.id, "open", {"timestamp": 9000.0}),
+                (tracking.id, "soft_bounce", {}),
+            ]
+        )
+        tracking.event_create("hard_bounce", {})
+        # The funnels are updated before the commit
+        self.env.cr.flush()
+        funnel = self.env["mailing.tracking.funnel"].search(
+            [("mass_mailing_id", "=", self.mailing.id)]
+        )
+        expected = {
+            "sent": 1,
+            "delivered": 1,
+            "opened": 1,
+            "clicked": 0,
+            "bounced": 1,
+            "spam": 0,
+            "unsub": 0,
+        }
+        self.assertRecordValues(funnel, [expected])
+        channel = self.env["mailing.tracking.funnel"]._funnel_channel(self.mailing.id)
+        notifications = self.env["bus.bus"].search([("channel", "like", channel)])
+        self.assertEqual(len(notifications), 1)
+        # The rebuild gives the same counters
+        self.env["mailing.tracking.funnel"]._rebuild()
+        funnel = self.env["mailing.tracking.funnel"].search(
+            [("mass_mailing_id", "=", self.mailing.id)]
+        )
+        self.assertRecordValues(funnel, [expected])
+
+    def test_stats_daily_mailing(self):
+        self.mailing.action_send_mail()
+        for stat in self.mailing.mailing_trace_ids:
+            if stat.mail_mail_id:
+                stat.mail_mail_id.send()
+            stat.mail_tracking_id.event_create("open", {"ua_family": "odoo"})
+        stats_obj = self.env["mail.tracking.stats.daily"]
+        stats_obj._rebuild()
+        stats = stats_obj.search(
+            [("mass_mailing_id", "=", self.mailing.id), ("event_type", "=", "open")]
+        )
+        self.assertEqual(sum(stats.mapped("count")), 1)
+        self.assertEqual(stats.ua_family, "odoo")